@@ -0,0 +1,49 @@
+"""
+Measures the polygon payload of the map figures for a GeoJSON file.
+
+    python -m benchmarks.geometry india_telengana.geojson
+
+For every simplification level it prints the size of the full-precision
+GeoJSON the maps used to embed, the quantized GeoJSON they embed now and
+the TopoJSON kept in the disk cache, plus the time to encode and decode.
+"""
+import argparse
+import json
+import time
+
+import geopandas as gpd
+
+from dashboard.geostore import SIMPLIFY_LEVELS, load_geometry
+from dashboard.topology import decode, encode
+
+
+def compact_size(obj):
+    return len(json.dumps(obj, separators=(",", ":")))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("geojson_path")
+    args = parser.parse_args(argv)
+
+    geometry = load_geometry(args.geojson_path)
+    print(f"{len(geometry.names)} features")
+    print(f"{'level':>5} {'full GeoJSON':>13} {'quantized':>10} {'TopoJSON':>10} {'encode':>8} {'decode':>8}")
+    for level in range(len(SIMPLIFY_LEVELS)):
+        geometries = geometry.simplified(level)
+        frame = gpd.GeoDataFrame(geometry=geometries, crs=geometry.gdf.crs)
+        full = compact_size(json.loads(frame.to_json(drop_id=False)))
+
+        start = time.perf_counter()
+        topology = encode(geometries)
+        encoded = time.perf_counter()
+        decode(topology)
+        decoded = time.perf_counter()
+        print(
+            f"{level:>5} {full:>13,} {geometry.geojson_size(level):>10,} {compact_size(topology):>10,}"
+            f" {(encoded - start) * 1000:>6.1f}ms {(decoded - encoded) * 1000:>6.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Compares the old melt + str.split reshape with the long frame the app builds:
+the cube parsed from the wide rows, reshaped by dashboard.reshape.cube_to_long.
+
+    python -m benchmarks.reshape --states 700 --years 30 --diseases 10
+"""
+import argparse
+import timeit
+
+from dashboard.datastore import DiseaseDataset
+
+from .synthetic import synthetic_wide
+
+
+def melt_split(wide):
+    # The reshape previously repeated in every component
+    data_melted = wide.melt(
+        id_vars=["States/UTs", "Short Form"], var_name="Year-Disease", value_name="Cases"
+    )
+    data_melted[["Year", "Disease"]] = data_melted["Year-Disease"].str.split("-", expand=True)
+    data_melted.drop(columns=["Year-Disease"], inplace=True)
+    return data_melted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--states", type=int, default=700)
+    parser.add_argument("--years", type=int, default=30)
+    parser.add_argument("--diseases", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    wide = synthetic_wide(args.states, args.years, args.diseases)
+    print(f"{len(wide)} rows x {wide.shape[1] - 2} Year-Disease columns")
+    for name, reshape in [
+        ("melt + str.split", melt_split),
+        ("cube_to_long", lambda frame: DiseaseDataset.from_wide(None, frame).long),
+    ]:
+        best = min(timeit.repeat(lambda: reshape(wide), number=1, repeat=args.repeat))
+        print(f"{name:>18}: {best * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
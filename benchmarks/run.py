@@ -0,0 +1,211 @@
+"""
+Benchmarks the data and figure pipeline on synthetic data of a given scale.
+
+    python -m benchmarks.run --states 700 --years 30 --diseases 10 --output results.json
+    python -m benchmarks.run --output new.json --compare results.json
+
+Every benchmark reports its first (cold) run and the best and median of
+``--repeat`` runs in milliseconds; serialization benchmarks also report
+the payload size. --output writes the results and the environment as
+JSON, and --compare prints the change against an earlier results file.
+"""
+import os
+
+# Repeats would otherwise be served from the figure and snapshot disk cache
+os.environ["NDMC_CACHE_DIR"] = ""
+
+import argparse
+import io
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import plotly
+import shapely
+from plotly.utils import PlotlyJSONEncoder
+
+from dashboard.aggregates import DiseaseAggregates
+from dashboard.datastore import DiseaseDataset, content_hash, ingest
+from dashboard.geostore import StateGeometry
+from dashboard.gridmap import PANEL_SIZE, grid_figure, grid_panels
+from dashboard.map import MAP_LAYOUT, map_figure, timeline_figure
+from dashboard.map_percent import percent_map_figure
+from dashboard.pie import pie_data
+from dashboard.radar import radar_data
+from dashboard.snapshot import read_snapshot, snapshot_bytes
+from dashboard.svgmap import svg_map
+
+from .reshape import melt_split
+from .synthetic import write_dataset
+
+COLOR_SCALE = ["#ff0000", "#0000ff"]
+GRID_YEARS = 6
+
+
+def measure(fn, repeat):
+    """Runs ``fn`` ``repeat`` times and returns (seconds per run, last result)."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return times, result
+
+
+def to_json(obj):
+    return json.dumps(obj, cls=PlotlyJSONEncoder)
+
+
+def environment(args):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "geopandas": gpd.__version__,
+        "shapely": shapely.__version__,
+        "plotly": plotly.__version__,
+        "scale": {
+            "states": args.states, "years": args.years, "diseases": args.diseases, "detail": args.detail,
+        },
+        "repeat": args.repeat,
+    }
+
+
+def benchmarks(csv_path, geojson_path, skip_timeline=False):
+    """
+    Yields (name, function, size) for every benchmark. ``size`` gives the
+    payload size in bytes of the function's result, or is None.
+    """
+    with open(csv_path, "rb") as f:
+        csv_bytes = f.read()
+    with open(geojson_path, "rb") as f:
+        geojson_bytes = f.read()
+    key = content_hash(csv_bytes)
+    wide = pd.read_csv(io.BytesIO(csv_bytes))
+    dataset = ingest(io.BytesIO(csv_bytes), key=key)
+    geometry = StateGeometry(content_hash(geojson_bytes), geojson_bytes)
+    year = dataset.years[len(dataset.years) // 2]
+    disease = dataset.diseases[0]
+    grid_years = dataset.years[:GRID_YEARS]
+
+    snapshot_path = os.path.join(os.path.dirname(csv_path), "DiseaseData.snap")
+    with open(snapshot_path, "wb") as f:
+        f.write(snapshot_bytes(dataset))
+
+    # Ingest and reshape
+    yield "ingest.stream", lambda: ingest(io.BytesIO(csv_bytes), key=key), None
+    yield "ingest.read_csv", lambda: pd.read_csv(io.BytesIO(csv_bytes)), None
+    yield "ingest.from_wide", lambda: DiseaseDataset.from_wide(key, wide), None
+    yield "reshape.melt_split", lambda: melt_split(wide), None
+    yield "reshape.cube_to_long", lambda: dataset.cube.to_long(dataset.ids), None
+    yield "snapshot.write", lambda: snapshot_bytes(dataset), len
+    yield "snapshot.read", lambda: DiseaseDataset(*read_snapshot(snapshot_path)).slice(year, disease), None
+    yield "aggregates.build", lambda: DiseaseAggregates(dataset.cube), None
+
+    # Geometry
+    yield "geometry.parse", lambda: StateGeometry(geometry.key, geojson_bytes).gdf, None
+    yield "geometry.topology", lambda: StateGeometry(geometry.key, geometry.gdf.copy()).topology(
+        geometry.level_for(MAP_LAYOUT["width"])
+    ), lambda topology: len(to_json(topology))
+
+    # Merge of one (year, disease) slice onto the polygons
+    yield "merge.gdf_merge", lambda: geometry.gdf.merge(
+        dataset.slice(year, disease), left_on="NAME_1", right_on="States/UTs"
+    ), None
+    yield "merge.join", lambda: geometry.join(dataset, year, disease), None
+
+    # Figure build, then JSON serialization of the built figure
+    figures = {
+        "map": lambda: map_figure(dataset, geometry, year, disease, COLOR_SCALE),
+        "percent": lambda: percent_map_figure(dataset, geometry, year, disease, COLOR_SCALE),
+        "grid": lambda: grid_figure(
+            geometry, grid_years, grid_panels(dataset, geometry, grid_years, disease), disease, COLOR_SCALE,
+        ),
+        "pie": lambda: pie_data(dataset.cube, year, disease),
+        "radar": lambda: radar_data(dataset.cube, year)[0],
+    }
+    if not skip_timeline:
+        figures["timeline"] = lambda: timeline_figure(dataset, geometry, COLOR_SCALE, year, disease)
+    for name, build in figures.items():
+        yield f"figure.{name}", build, None
+        fig = build()
+        yield f"json.{name}", lambda fig=fig: to_json(fig), len
+    yield "figure.svg", lambda: svg_map(dataset, geometry, year, disease, COLOR_SCALE, width=PANEL_SIZE), len
+
+
+def run(args):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path, geojson_path = write_dataset(tmp, args.states, args.years, args.diseases, args.detail)
+        for name, fn, size in benchmarks(csv_path, geojson_path, args.skip_timeline):
+            if args.only and not any(name.startswith(prefix) for prefix in args.only):
+                continue
+            times, result = measure(fn, args.repeat)
+            entry = {
+                "name": name,
+                "first_ms": times[0] * 1000,
+                "best_ms": min(times) * 1000,
+                "median_ms": statistics.median(times) * 1000,
+            }
+            if size is not None:
+                entry["bytes"] = size(result)
+            results.append(entry)
+            print(
+                f"{name:<24} first {entry['first_ms']:9.1f} ms  best {entry['best_ms']:9.1f} ms"
+                + (f"  {entry['bytes']:>12,} bytes" if "bytes" in entry else "")
+            )
+    return results
+
+
+def compare(results, path):
+    with open(path) as f:
+        previous = {entry["name"]: entry for entry in json.load(f)["results"]}
+    print(f"\nChange against {path} (best run):")
+    for entry in results:
+        before = previous.get(entry["name"])
+        if before and before["best_ms"] > 0:
+            ratio = entry["best_ms"] / before["best_ms"]
+            print(f"{entry['name']:<24} {before['best_ms']:9.1f} -> {entry['best_ms']:9.1f} ms  x{ratio:.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--states", type=int, default=36)
+    parser.add_argument("--years", type=int, default=6)
+    parser.add_argument("--diseases", type=int, default=2)
+    parser.add_argument("--detail", type=int, default=50, help="Vertices per shared border of the polygons")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="+", help="Run the benchmarks whose names start with these prefixes")
+    parser.add_argument("--skip-timeline", action="store_true", help="Skip the all-years timeline figure")
+    parser.add_argument("--output", help="Write the results as JSON to this path")
+    parser.add_argument("--compare", help="Results JSON of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"environment": environment(args), "results": results}, f, indent=2)
+        print(f"\nWrote {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Synthetic disease data at a configurable scale.
+
+    python -m benchmarks.synthetic --states 700 --years 30 --diseases 10 --out bench_data
+
+writes bench_data/DiseaseData.csv, shaped like the real wide CSV, and
+bench_data/regions.geojson with one polygon per region. The polygons form
+a gap-free coverage whose shared borders carry ``--detail`` vertices each,
+so the geometry code sees realistic vertex counts.
+"""
+import argparse
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+# Bounding box of the generated polygons, roughly India's
+LON_RANGE = (68.0, 97.0)
+LAT_RANGE = (8.0, 37.0)
+
+
+def region_names(states):
+    return [f"Region {i}" for i in range(states)]
+
+
+def synthetic_wide(states, years, diseases, seed=0):
+    """Wide frame shaped like DiseaseData.csv with random case counts."""
+    rng = np.random.default_rng(seed)
+    data = {
+        "States/UTs": region_names(states),
+        "Short Form": [f"R{i}" for i in range(states)],
+    }
+    for year in range(2000, 2000 + years):
+        for disease in range(diseases):
+            data[f"{year}-Disease{disease}"] = rng.integers(0, 200_000, states)
+    return pd.DataFrame(data)
+
+
+def synthetic_geojson(states, detail=50, seed=0):
+    """
+    GeoJSON FeatureCollection with one polygon per region, NAME_1 as in synthetic_wide.
+    Regions are the cells of a jittered grid; every edge between two grid
+    corners gets ``detail`` wiggling vertices, generated once and used by
+    both neighbours so borders match exactly.
+    """
+    rng = np.random.default_rng(seed)
+    columns = math.ceil(math.sqrt(states))
+    rows = math.ceil(states / columns)
+    step_x = (LON_RANGE[1] - LON_RANGE[0]) / columns
+    step_y = (LAT_RANGE[1] - LAT_RANGE[0]) / rows
+
+    # Grid corners, moved by up to a quarter cell except on the outer boundary
+    gx, gy = np.meshgrid(np.arange(columns + 1, dtype=float), np.arange(rows + 1, dtype=float))
+    inner = (gx > 0) & (gx < columns) & (gy > 0) & (gy < rows)
+    gx[inner] += rng.uniform(-0.25, 0.25, inner.sum())
+    gy[inner] += rng.uniform(-0.25, 0.25, inner.sum())
+    corners = np.stack([LON_RANGE[0] + gx * step_x, LAT_RANGE[0] + gy * step_y], axis=-1)
+
+    edges = {}
+
+    def edge(a, b):
+        # Points from corner a to corner b, excluding b
+        if (b, a) in edges:
+            # Walked the other way by the neighbour: start at a, then its points backwards
+            return np.vstack([corners[a], edges[(b, a)][:0:-1]])
+        start, end = corners[a], corners[b]
+        t = np.linspace(0, 1, detail + 2)[:-1]
+        normal = np.array([start[1] - end[1], end[0] - start[0]])
+        on_boundary = (a[0] == b[0] and a[0] in (0, rows)) or (a[1] == b[1] and a[1] in (0, columns))
+        offset = np.zeros(len(t))
+        if not on_boundary and detail:
+            offset = np.cumsum(rng.normal(0, 0.6 / detail, len(t)))
+            offset = (offset - offset[-1] * t) * np.sin(np.pi * t) * 0.5
+        points = start + np.outer(t, end - start) + np.outer(offset, normal)
+        edges[(a, b)] = points
+        return points
+
+    features = []
+    for i, name in enumerate(region_names(states)):
+        r, c = divmod(i, columns)
+        ring_corners = [(r, c), (r, c + 1), (r + 1, c + 1), (r + 1, c)]
+        ring = np.vstack([edge(a, b) for a, b in zip(ring_corners, ring_corners[1:] + ring_corners[:1])])
+        ring = np.vstack([ring, ring[:1]])
+        features.append({
+            "type": "Feature",
+            "properties": {"NAME_1": name},
+            "geometry": {"type": "Polygon", "coordinates": [np.round(ring, 6).tolist()]},
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+
+def write_dataset(out_dir, states, years, diseases, detail=50, seed=0):
+    """Writes DiseaseData.csv and regions.geojson into ``out_dir`` and returns their paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    csv_path = os.path.join(out_dir, "DiseaseData.csv")
+    geojson_path = os.path.join(out_dir, "regions.geojson")
+    synthetic_wide(states, years, diseases, seed).to_csv(csv_path, index=False)
+    with open(geojson_path, "w") as f:
+        json.dump(synthetic_geojson(states, detail, seed), f)
+    return csv_path, geojson_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--states", type=int, default=700)
+    parser.add_argument("--years", type=int, default=30)
+    parser.add_argument("--diseases", type=int, default=10)
+    parser.add_argument("--detail", type=int, default=50, help="Vertices per shared border")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_data")
+    args = parser.parse_args(argv)
+
+    for path in write_dataset(args.out, args.states, args.years, args.diseases, args.detail, args.seed):
+        print(f"Wrote {path} ({os.path.getsize(path):,} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,4 +7,10 @@ from .player import Player
 from .radar import Radar
 from .map import DiseaseMap
 from .gridmap import GridMap
-from .map_percent import DiseasePercentMap
\ No newline at end of file
+from .svgmap import SvgGridMap
+from .map_percent import DiseasePercentMap
+from .datastore import DataSource, SessionHandle, data_source, dataset_stats, load_dataset
+from .geostore import geometry_stats, load_geometry
+from .diskcache import figure_cache
+from .prefetch import prefetcher
+from .timing import rerun, show_panel, stage
\ No newline at end of file
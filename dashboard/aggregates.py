@@ -0,0 +1,118 @@
+import numpy as np
+
+
+def _slice_tables(values, observed):
+    """
+    Totals, peaks, shares and ranks of case count slices.
+    :param values: Counts with the states along the last axis.
+    :param observed: bool array of the same shape.
+    """
+    cases = np.where(observed, values, 0).astype(np.int64)
+    n_states = cases.shape[-1]
+
+    totals = cases.sum(axis=-1)
+    peaks = cases.max(axis=-1, initial=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = np.where(observed, cases * 100 / totals[..., None], np.nan)
+
+    # Stable sort of the negated counts, so ties keep the CSV order
+    order = np.argsort(np.where(observed, -cases, np.iinfo(np.int64).max), axis=-1, kind="stable")
+    ranks = np.empty(cases.shape, dtype=float)
+    np.put_along_axis(ranks, order, np.broadcast_to(np.arange(1, n_states + 1), cases.shape), axis=-1)
+    return totals, peaks, shares, np.where(observed, ranks, np.nan)
+
+
+class DiseaseAggregates:
+    """
+    Totals, shares, ranks and year-over-year changes of a DiseaseCube, computed once.
+    :param cube: DiseaseCube to aggregate.
+
+    Every table is a read-only array laid out like the cube, so a render
+    reads its numbers with one index instead of a group-by:
+    ``totals`` and ``peaks`` (national sum and largest state count) are
+    Year x Disease; ``shares`` (percent of the national total), ``ranks``
+    (1 = most cases, ties in CSV order) and ``changes`` (cases minus the
+    previous year in the data) are Year x Disease x State and NaN where
+    the CSV had no value.
+
+    Given the aggregates of an earlier version of the cube and the
+    (year, disease) slices that differ from it (see DiseaseDataset.update),
+    only those slices, and the changes of the year after each, are
+    computed; the other slices are copied from ``previous``.
+    :param previous: DiseaseAggregates of the earlier cube, with the same states.
+    :param changed: Set of (year, disease) slices that differ from it.
+    """
+
+    def __init__(self, cube, previous=None, changed=None):
+        self.cube = cube
+        n_years, n_diseases, _ = cube.values.shape
+        if previous is None or previous.cube.states != cube.states or len(changed) == n_years * n_diseases:
+            self._build(cube)
+        else:
+            self._update(cube, previous, changed)
+
+        for table in (self.totals, self.peaks, self.shares, self.ranks, self.changes):
+            table.setflags(write=False)
+
+    def _build(self, cube):
+        observed = cube.observed
+        self.totals, self.peaks, self.shares, self.ranks = _slice_tables(cube.values, observed)
+        cases = np.where(observed, cube.values, 0).astype(np.int64)
+        self.changes = np.full(cases.shape, np.nan)
+        self.changes[1:] = np.where(observed[1:] & observed[:-1], cases[1:] - cases[:-1], np.nan)
+
+    def _update(self, cube, previous, changed):
+        # Copy every slice of the earlier cube to its place on the grown axes
+        old_years = [cube.year_index[year] for year in previous.cube.years]
+        old_diseases = [cube.disease_index[disease] for disease in previous.cube.diseases]
+        old = np.ix_(old_years, old_diseases)
+        shape = cube.values.shape
+        self.totals = np.zeros(shape[:2], dtype=np.int64)
+        self.peaks = np.zeros(shape[:2], dtype=np.int64)
+        self.shares, self.ranks, self.changes = (np.full(shape, np.nan) for _ in range(3))
+        for name in ("totals", "peaks", "shares", "ranks", "changes"):
+            getattr(self, name)[old] = getattr(previous, name)
+
+        if not changed:
+            return
+        y = np.array([cube.year_index[year] for year, _ in changed], dtype=np.intp)
+        d = np.array([cube.disease_index[disease] for _, disease in changed], dtype=np.intp)
+        self.totals[y, d], self.peaks[y, d], self.shares[y, d], self.ranks[y, d] = _slice_tables(
+            cube.values[y, d], cube.observed[y, d]
+        )
+
+        # A slice's change also depends on the year before it
+        pairs = set(zip(y.tolist(), d.tolist()))
+        pairs |= {(yi + 1, di) for yi, di in pairs if yi + 1 < shape[0]}
+        y, d = (np.array(axis, dtype=np.intp) for axis in zip(*pairs))
+        first = y == 0
+        self.changes[y[first], d[first]] = np.nan
+        y, d = y[~first], d[~first]
+        observed = cube.observed[y, d] & cube.observed[y - 1, d]
+        cases = cube.values[y, d].astype(np.int64) - cube.values[y - 1, d]
+        self.changes[y, d] = np.where(observed, cases, np.nan)
+
+    def _index(self, year, disease):
+        return self.cube.year_index[str(year)], self.cube.disease_index[disease]
+
+    def total(self, year, disease):
+        """National total of one (year, disease), 0 if it is not in the data."""
+        if (str(year), disease) not in self.cube:
+            return 0
+        return int(self.totals[self._index(year, disease)])
+
+    def peak(self, disease):
+        """Largest count of any state in any year, e.g. for a color range shared across years."""
+        return int(self.peaks[:, self.cube.disease_index[disease]].max(initial=0))
+
+    def share(self, year, disease):
+        """Percent of the national total per state."""
+        return self.shares[self._index(year, disease)]
+
+    def rank(self, year, disease):
+        """Rank per state, 1 for the most cases."""
+        return self.ranks[self._index(year, disease)]
+
+    def change(self, year, disease):
+        """Cases per state minus the previous year's."""
+        return self.changes[self._index(year, disease)]
@@ -0,0 +1,89 @@
+import numpy as np
+
+from .reshape import cube_to_long, parse_headers
+
+
+# Largest case count the int32 cube holds
+MAX_CASES = int(np.iinfo(np.int32).max)
+
+
+def case_counts(cases, columns):
+    """
+    Converts the float Value column x Row array read from a CSV into the
+    cube's int32 counts (0 where missing) and the observed mask.
+    Raises ValueError for fractional counts or counts above MAX_CASES
+    rather than truncating or wrapping them.
+    :param columns: Header of each value column, named in the error.
+    """
+    present = ~np.isnan(cases)
+    filled = np.where(present, cases, 0)
+    invalid = (np.abs(filled) > MAX_CASES) | (filled != np.round(filled))
+    if invalid.any():
+        column, row = np.argwhere(invalid)[0]
+        raise ValueError(
+            f"Column {columns[column]!r} holds {float(filled[column, row])}; "
+            f"case counts must be whole numbers of at most {MAX_CASES:,}"
+        )
+    return filled.astype(np.int32), present
+
+
+class DiseaseCube:
+    """
+    Dense Year x Disease x State array of case counts.
+    :param years: Year labels (strings) along axis 0.
+    :param diseases: Disease labels along axis 1.
+    :param states: State names along axis 2.
+    :param values: int32 array of shape (years, diseases, states).
+    :param observed: bool array of the same shape, False where the CSV had no value.
+
+    Lookups return views into ``values``, so callers must not write to them.
+    """
+
+    def __init__(self, years, diseases, states, values, observed):
+        self.years = list(years)
+        self.diseases = list(diseases)
+        self.states = list(states)
+        self.values = values
+        self.observed = observed
+        self.year_index = {year: i for i, year in enumerate(self.years)}
+        self.disease_index = {disease: i for i, disease in enumerate(self.diseases)}
+        self.state_index = {state: i for i, state in enumerate(self.states)}
+
+    @classmethod
+    def from_wide(cls, wide, state_column="States/UTs"):
+        value_columns, years, diseases, year_codes, disease_codes = parse_headers(wide.columns)
+        states = wide[state_column].tolist()
+
+        values = np.zeros((len(years), len(diseases), len(states)), dtype=np.int32)
+        observed = np.zeros(values.shape, dtype=bool)
+        cases, present = case_counts(wide[value_columns].to_numpy(dtype=float).T, value_columns)
+        values[year_codes, disease_codes] = cases
+        observed[year_codes, disease_codes] = present
+        return cls(years, diseases, states, values, observed)
+
+    def to_long(self, ids):
+        """
+        Tidy frame with one row per (year, disease, state), in that order.
+        :param ids: One row per state with the id columns, in cube order.
+        """
+        return cube_to_long(ids, self.years, self.diseases, self.values, self.observed)
+
+    def __contains__(self, item):
+        year, disease = item
+        return year in self.year_index and disease in self.disease_index
+
+    def choropleth(self, year, disease):
+        """Cases per state for one (year, disease)."""
+        return self.values[self.year_index[str(year)], self.disease_index[disease]]
+
+    def state_series(self, state, disease):
+        """Cases per year for one state and disease."""
+        return self.values[:, self.disease_index[disease], self.state_index[state]]
+
+    def disease_vector(self, year, state):
+        """Cases per disease for one state in one year."""
+        return self.values[self.year_index[str(year)], :, self.state_index[state]]
+
+    def year_matrix(self, year):
+        """Disease x State matrix for one year."""
+        return self.values[self.year_index[str(year)]]
@@ -0,0 +1,572 @@
+import hashlib
+import io
+import os
+import weakref
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+
+from .aggregates import DiseaseAggregates
+from .cube import DiseaseCube, case_counts
+from .reshape import parse_headers
+from .diskcache import cache_key, disk_cache
+from .snapshot import SNAPSHOT_SUFFIX, is_snapshot, read_snapshot, snapshot_bytes
+
+
+# Number of parsed datasets kept in memory once no session uses them
+MAX_DATASETS = 8
+
+# Number of uploaded files whose content hash is remembered
+MAX_SOURCES = 16
+
+# Rows of the wide CSV parsed at a time by the streaming ingest
+INGEST_CHUNK_ROWS = 16384
+
+ID_COLUMNS = ["States/UTs", "Short Form"]
+
+
+class DiseaseDataset:
+    """
+    Parsed disease data for one CSV file.
+    :param key: Content hash of the raw CSV bytes.
+    :param ids: One row per state with the id columns (States/UTs, Short Form).
+    :param cube: DiseaseCube with the case counts, states in the order of ``ids``.
+
+    ``long`` is the tidy frame (States/UTs, Short Form, Cases, Year,
+    Disease) shared by every component, reshaped from the cube on first
+    use (see reshape.cube_to_long); ``cube`` holds the same
+    numbers as a Year x Disease x State array and ``aggregates`` the
+    totals, shares, ranks and changes derived from it. All are shared
+    between reruns and sessions, so treat them as read-only.
+    """
+
+    def __init__(self, key, ids, cube):
+        self.key = key
+        self.ids = ids
+        self.id_columns = list(ids.columns)
+        self.cube = cube
+        self._long = None
+        self._aggregates = None
+        self.years = list(cube.years)
+        self.diseases = list(cube.diseases)
+        self._ids_key = None
+        self._slice_keys = {}
+
+    @property
+    def long(self):
+        if self._long is None:
+            self._long = self.cube.to_long(self.ids)
+        return self._long
+
+    @property
+    def aggregates(self):
+        # Built once per dataset; an update() gives a new dataset and new tables
+        if self._aggregates is None:
+            self._aggregates = DiseaseAggregates(self.cube)
+        return self._aggregates
+
+    @property
+    def nbytes(self):
+        """
+        Bytes held by the ids, the cube and the tables derived so far.
+        Memory-mapped cubes (see snapshot.py) count in full, although their
+        pages are shared with other processes mapping the same file.
+        """
+        size = int(self.ids.memory_usage(deep=True).sum()) + self.cube.values.nbytes + self.cube.observed.nbytes
+        if self._long is not None:
+            size += int(self._long.memory_usage(deep=True).sum())
+        if self._aggregates is not None:
+            aggregates = self._aggregates
+            size += sum(
+                table.nbytes for table in (
+                    aggregates.totals, aggregates.peaks, aggregates.shares,
+                    aggregates.ranks, aggregates.changes,
+                )
+            )
+        return size
+
+    @classmethod
+    def from_wide(cls, key, wide):
+        """Builds the dataset from the wide frame as read from the CSV."""
+        wide = _clean_wide(wide)
+        id_columns = [c for c in ID_COLUMNS if c in wide.columns]
+        return cls(
+            key,
+            wide[id_columns].reset_index(drop=True),
+            DiseaseCube.from_wide(wide),
+        )
+
+    def slice(self, year, disease):
+        """
+        Returns one row per state for a single year and disease, read from the cube.
+        Besides Cases it carries the state's Percent of the national total,
+        its Rank and its Change from the previous year, read from ``aggregates``.
+        The frame is empty if the year or disease is not in the data.
+        """
+        columns = self.id_columns + ["Cases", "Percent", "Rank", "Change", "Year", "Disease"]
+        if (str(year), disease) not in self.cube:
+            # Typed like a full slice, so string and number operations still apply
+            frame = self.ids.iloc[:0].copy()
+            for column, dtype in [("Cases", np.int64), ("Percent", float), ("Rank", np.int64),
+                                  ("Change", float), ("Year", str), ("Disease", str)]:
+                frame[column] = pd.Series(dtype=dtype)
+            return frame[columns]
+        y = self.cube.year_index[str(year)]
+        d = self.cube.disease_index[disease]
+        frame = self.ids.copy()
+        observed = self.cube.observed[y, d]
+        cases = self.cube.values[y, d].astype(np.int64)
+        # Same dtype read_csv would give: ints, or floats with NaN for gaps
+        frame["Cases"] = cases if observed.all() else np.where(observed, cases, np.nan)
+        frame["Percent"] = self.aggregates.share(year, disease)
+        ranks = self.aggregates.rank(year, disease)
+        frame["Rank"] = ranks.astype(np.int64) if observed.all() else ranks
+        frame["Change"] = self.aggregates.change(year, disease)
+        frame["Year"] = str(year)
+        frame["Disease"] = disease
+        return frame[columns]
+
+    def slice_key(self, year, disease):
+        """
+        Content hash of the state ids and one (year, disease) slice.
+        Unlike ``key`` it only changes when that slice does, so figures of
+        a single year and disease stay cached when other columns are
+        appended or corrected.
+        """
+        item = (str(year), disease)
+        key = self._slice_keys.get(item)
+        if key is None:
+            if self._ids_key is None:
+                hashed = pd.util.hash_pandas_object(self.ids, index=False)
+                self._ids_key = hashlib.sha1(hashed.to_numpy().tobytes()).hexdigest()
+            hasher = hashlib.sha1(self._ids_key.encode("utf-8"))
+            if item in self.cube:
+                y = self.cube.year_index[item[0]]
+                d = self.cube.disease_index[disease]
+                hasher.update(np.ascontiguousarray(self.cube.values[y, d]).tobytes())
+                hasher.update(np.ascontiguousarray(self.cube.observed[y, d]).tobytes())
+            key = self._slice_keys[item] = hasher.hexdigest()
+        return key
+
+    def update(self, wide, key):
+        """
+        Returns a new dataset with a wide delta frame applied.
+        New Year-Disease columns are added, the non-empty cells of existing
+        columns replace the current values and states not in the data yet
+        are appended. Only the delta is parsed; the existing counts are
+        copied as arrays. Slices the delta leaves unchanged keep their
+        slice_key, so their cached figures stay valid, and their aggregates
+        when this dataset's were built already.
+        :param wide: Wide frame with States/UTs and the Year-Disease columns to apply.
+        :param key: Key of the updated dataset.
+        :return: (dataset, changed) where ``changed`` is the set of
+            (year, disease) slices whose slice_key differs.
+        """
+        wide = _clean_wide(wide)
+        value_columns, years, diseases, year_codes, disease_codes = parse_headers(wide.columns)
+        cube = self.cube
+
+        # Grow the axes: years stay sorted, new diseases and states go last
+        all_years = sorted(set(cube.years) | set(years))
+        all_diseases = cube.diseases + [d for d in diseases if d not in cube.disease_index]
+        new_states = np.array([state not in cube.state_index for state in wide["States/UTs"]], dtype=bool)
+        added = wide.loc[new_states].drop_duplicates("States/UTs")
+        ids = self.ids
+        if len(added):
+            ids = pd.concat([ids, added.reindex(columns=self.id_columns)], ignore_index=True)
+        states = ids["States/UTs"].tolist()
+
+        year_pos = {year: i for i, year in enumerate(all_years)}
+        disease_pos = {disease: i for i, disease in enumerate(all_diseases)}
+        state_pos = {state: i for i, state in enumerate(states)}
+        shape = (len(all_years), len(all_diseases), len(states))
+        values = np.zeros(shape, dtype=np.int32)
+        observed = np.zeros(shape, dtype=bool)
+        old_years = np.array([year_pos[year] for year in cube.years], dtype=np.intp)
+        n_diseases, n_states = len(cube.diseases), len(cube.states)
+        values[old_years, :n_diseases, :n_states] = cube.values
+        observed[old_years, :n_diseases, :n_states] = cube.observed
+
+        # Write the observed cells of the delta over the copied counts
+        y = np.array([year_pos[year] for year in years], dtype=np.intp)[year_codes]
+        d = np.array([disease_pos[disease] for disease in diseases], dtype=np.intp)[disease_codes]
+        s = np.array([state_pos[state] for state in wide["States/UTs"]], dtype=np.intp)
+        cases, present = case_counts(wide[value_columns].to_numpy(dtype=float).T, value_columns)
+        columns, rows = np.nonzero(present)
+        values[y[columns], d[columns], s[rows]] = cases[columns, rows]
+        observed[y[columns], d[columns], s[rows]] = True
+
+        updated = DiseaseDataset(key, ids, DiseaseCube(all_years, all_diseases, states, values, observed))
+        if len(added):
+            # Every slice gains the new states
+            return updated, {(year, disease) for year in all_years for disease in all_diseases}
+
+        # New (year, disease) pairs, plus existing ones whose cells differ
+        changed = {
+            (year, disease) for year in all_years for disease in all_diseases
+            if (year, disease) not in cube
+        }
+        for yi, di in set(zip(y.tolist(), d.tolist())):
+            item = (all_years[yi], all_diseases[di])
+            if item in changed:
+                continue
+            oy, od = cube.year_index[item[0]], cube.disease_index[item[1]]
+            if not (np.array_equal(values[yi, di], cube.values[oy, od])
+                    and np.array_equal(observed[yi, di], cube.observed[oy, od])):
+                changed.add(item)
+        updated._ids_key = self._ids_key
+        updated._slice_keys = {
+            item: slice_key for item, slice_key in self._slice_keys.items() if item not in changed
+        }
+        if self._aggregates is not None:
+            # Only the changed slices are aggregated again
+            updated._aggregates = DiseaseAggregates(updated.cube, previous=self._aggregates, changed=changed)
+        return updated, changed
+
+
+def _clean_wide(wide):
+    wide = wide.rename(columns={"State/UT": "States/UTs"})
+    for column in ID_COLUMNS:
+        if column in wide.columns:
+            wide[column] = wide[column].str.strip()
+    return wide
+
+
+class _HashingReader:
+    """File wrapper that hashes the bytes as pandas reads them."""
+
+    def __init__(self, f, hasher):
+        self._f = f
+        self._hasher = hasher
+
+    def read(self, size=-1):
+        data = self._f.read(size)
+        self._hasher.update(data)
+        return data
+
+    def __iter__(self):
+        return iter(self.readline, b"")
+
+    def readline(self, size=-1):
+        data = self._f.readline(size)
+        self._hasher.update(data)
+        return data
+
+
+def _open_binary(source):
+    if hasattr(source, "getvalue"):
+        return io.BytesIO(source.getvalue())
+    if hasattr(source, "read"):
+        source.seek(0)
+        return source
+    return open(source, "rb")
+
+
+def ingest(source, key=None, chunksize=INGEST_CHUNK_ROWS):
+    """
+    Streams a wide CSV into a DiseaseDataset, a block of rows at a time.
+    The Year-Disease headers are parsed once and every block goes straight
+    into its slab of the cube; the slabs are joined once at the end, so
+    the wide frame is never held in full and the file is read only once.
+    :param source: File path or file-like object with the wide disease CSV.
+    :param key: Content hash of the source if already known.
+    :param chunksize: Rows parsed per block.
+    """
+    hasher = hashlib.sha1()
+    f = _open_binary(source)
+    try:
+        reader = pd.read_csv(_HashingReader(f, hasher) if key is None else f, chunksize=chunksize)
+        ids, values, observed = [], [], []
+        for chunk in reader:
+            chunk = _clean_wide(chunk)
+            if not ids:
+                id_columns = [c for c in ID_COLUMNS if c in chunk.columns]
+                value_columns, years, diseases, year_codes, disease_codes = parse_headers(chunk.columns)
+
+            cases, present = case_counts(chunk[value_columns].to_numpy(dtype=float).T, value_columns)
+            block = np.zeros((len(years), len(diseases), len(chunk)), dtype=np.int32)
+            block_observed = np.zeros(block.shape, dtype=bool)
+            block[year_codes, disease_codes] = cases
+            block_observed[year_codes, disease_codes] = present
+            values.append(block)
+            observed.append(block_observed)
+            ids.append(chunk[id_columns])
+    finally:
+        if f is not source:
+            f.close()
+
+    frame = pd.concat(ids, ignore_index=True)
+    cube = DiseaseCube(
+        years, diseases, frame["States/UTs"].tolist(),
+        np.concatenate(values, axis=2), np.concatenate(observed, axis=2),
+    )
+    # Finished reading: the dataset is identified by its full content hash
+    return DiseaseDataset(key or hasher.hexdigest(), frame, cube)
+
+
+def _read_bytes(source):
+    # Uploaded files (streamlit UploadedFile, BytesIO) expose getvalue()
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    if hasattr(source, "read"):
+        source.seek(0)
+        return source.read()
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def content_hash(raw):
+    return hashlib.sha1(raw).hexdigest()
+
+
+class DataSource:
+    """
+    Contents of an uploaded file, read and hashed once.
+    :param key: Content hash of ``raw``.
+    :param name: File name, for display.
+    :param raw: File contents as bytes.
+
+    Pass it wherever a path or uploaded file is accepted (load_dataset,
+    load_geometry and the components). The caches look it up by ``key``
+    without hashing the contents again, and parse ``raw`` in memory.
+    """
+
+    def __init__(self, key, name, raw):
+        self.key = key
+        self.name = name
+        self.raw = raw
+
+    def getvalue(self):
+        return self.raw
+
+    def __repr__(self):
+        return f"DataSource({self.name!r}, {self.key[:12]})"
+
+
+_sources = OrderedDict()
+_sources_lock = Lock()
+
+
+def data_source(source):
+    """
+    Returns a DataSource for an uploaded file, hashing its contents only on
+    the first call for the upload. Identical uploads, also from other
+    sessions, get the same DataSource. Other file-like objects are hashed
+    on every call. Paths, DataSources and None are returned unchanged.
+    :param source: Streamlit UploadedFile or other file-like object.
+    """
+    if source is None or isinstance(source, (str, os.PathLike, DataSource)):
+        return source
+
+    # A new UploadedFile object is created on every rerun, but its file_id
+    # stays the same for as long as the upload is kept. Other objects have
+    # no such id (id() is reused once they are freed), so they are not remembered.
+    upload_id = getattr(source, "file_id", None)
+    if upload_id is not None:
+        with _sources_lock:
+            if upload_id in _sources:
+                _sources.move_to_end(upload_id)
+                return _sources[upload_id]
+
+    # getvalue() of a BytesIO shares its buffer instead of copying it
+    raw = _read_bytes(source)
+    key = content_hash(raw)
+    with _sources_lock:
+        shared = next((s for s in _sources.values() if s.key == key), None)
+        shared = shared or DataSource(key, getattr(source, "name", None), raw)
+        if upload_id is None:
+            return shared
+        _sources[upload_id] = shared
+        _sources.move_to_end(upload_id)
+        while len(_sources) > MAX_SOURCES:
+            _sources.popitem(last=False)
+        return shared
+
+
+class SessionHandle:
+    """
+    Marks the cached datasets and geometries used by one session, see ContentCache.
+    Keep it in st.session_state: what it holds stays loaded until
+    Streamlit drops the session and the handle is garbage collected.
+    """
+
+
+class ContentCache:
+    """
+    Process-wide registry of objects built from file contents, keyed by content hash.
+    :param build: Called as build(key, raw_bytes) on a miss.
+    :param max_entries: Number of entries without a live SessionHandle kept
+        before the least recently used is dropped.
+
+    Every session loading the same contents gets the same object. Entries
+    are pinned while any session holds them; handles are weakly referenced,
+    so a closed session releases its entries without an explicit call.
+    """
+
+    def __init__(self, build, max_entries):
+        self._build = build
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._holders = {}
+        self._path_keys = {}
+        self._lock = Lock()
+
+    def _path_key(self, source):
+        """Returns the cached content hash of a file path if it has not changed on disk."""
+        if not isinstance(source, (str, os.PathLike)):
+            return None
+        try:
+            stat = os.stat(source)
+        except OSError:
+            return None
+        entry = self._path_keys.get(os.fspath(source))
+        if entry and entry[0] == (stat.st_mtime_ns, stat.st_size):
+            return entry[1]
+        return None
+
+    def _get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        return None
+
+    def _hold(self, key, holder):
+        if holder is not None:
+            with self._lock:
+                self._holders.setdefault(key, weakref.WeakSet()).add(holder)
+
+    def get_or_build(self, key, build, holder=None):
+        """
+        Returns the entry for ``key``, calling build() to create it on a miss.
+        :param holder: SessionHandle that keeps the entry loaded while it is alive.
+        """
+        value = self._get(key)
+        if value is not None:
+            self._hold(key, holder)
+            return value
+
+        value = build()
+        with self._lock:
+            value = self._entries.setdefault(key, value)
+            self._entries.move_to_end(key)
+            if holder is not None:
+                self._holders.setdefault(key, weakref.WeakSet()).add(holder)
+            # Only entries no live session holds count towards the limit
+            unheld = [k for k in self._entries if not self._holders.get(k)]
+            for k in unheld[:max(0, len(unheld) - self._max_entries)]:
+                del self._entries[k]
+                self._holders.pop(k, None)
+        return value
+
+    def load(self, source, holder=None):
+        if isinstance(source, DataSource):
+            return self.get_or_build(source.key, lambda: self._build(source.key, source.raw), holder)
+
+        key = self._path_key(source)
+        value = self._get(key)
+        if value is not None:
+            self._hold(key, holder)
+            return value
+
+        raw = _read_bytes(source)
+        key = content_hash(raw)
+        if isinstance(source, (str, os.PathLike)):
+            stat = os.stat(source)
+            self._path_keys[os.fspath(source)] = ((stat.st_mtime_ns, stat.st_size), key)
+        return self.get_or_build(key, lambda: self._build(key, raw), holder)
+
+    def stats(self):
+        """
+        One dict per entry, least recently used first: its content ``key``,
+        the number of live ``sessions`` holding it and its size in ``bytes``.
+        """
+        with self._lock:
+            entries = [(value, len(self._holders.get(key, ()))) for key, value in self._entries.items()]
+        return [{"key": value.key, "sessions": sessions, "bytes": value.nbytes} for value, sessions in entries]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._holders.clear()
+            self._path_keys.clear()
+
+
+def _build_dataset(key, raw):
+    disk = disk_cache()
+    if disk is None:
+        return ingest(io.BytesIO(raw), key=key)
+
+    # Parse once, then load through the snapshot in the disk cache so that
+    # every worker maps the same file instead of holding its own copy
+    snapshot_key = cache_key("dataset", key)
+    path = disk.get_path(snapshot_key, SNAPSHOT_SUFFIX)
+    if path is None:
+        dataset = ingest(io.BytesIO(raw), key=key)
+        path = disk.put_bytes(snapshot_key, SNAPSHOT_SUFFIX, snapshot_bytes(dataset))
+    return DiseaseDataset(*read_snapshot(path))
+
+
+_datasets = ContentCache(_build_dataset, MAX_DATASETS)
+
+
+def _snapshot_path(source):
+    """The snapshot to load for a path: the path itself, or a newer .snap next to a CSV."""
+    if not isinstance(source, (str, os.PathLike)):
+        return None
+    if is_snapshot(source):
+        return os.fspath(source)
+    sibling = os.path.splitext(os.fspath(source))[0] + SNAPSHOT_SUFFIX
+    try:
+        if os.stat(sibling).st_mtime_ns >= os.stat(source).st_mtime_ns:
+            return sibling
+    except OSError:
+        pass
+    return None
+
+
+def load_dataset(source, holder=None):
+    """
+    Returns the parsed dataset for a CSV path, a snapshot path, an uploaded buffer or a DataSource.
+    Identical contents share one DiseaseDataset across reruns and sessions.
+    Datasets held by a live ``holder`` stay loaded; of the others, the
+    least recently used are dropped beyond MAX_DATASETS. A snapshot
+    (see snapshot.py) is memory-mapped instead of parsed, and is used in
+    place of a CSV when it sits next to it and is newer.
+    :param source: File path, file-like object or DataSource with the wide disease CSV.
+    :param holder: SessionHandle of the session using the dataset.
+    """
+    snapshot = _snapshot_path(source)
+    if snapshot is not None:
+        stat = os.stat(snapshot)
+        return _datasets.get_or_build(
+            ("snapshot", snapshot, stat.st_mtime_ns, stat.st_size),
+            lambda: DiseaseDataset(*read_snapshot(snapshot)),
+            holder,
+        )
+    return _datasets.load(source, holder)
+
+
+def update_dataset(dataset, source):
+    """
+    Applies a delta CSV to a loaded dataset, see DiseaseDataset.update.
+    The result is keyed by the base key and the delta's content hash and
+    is kept with the other loaded datasets.
+    :param source: File path or file-like object with the wide delta CSV.
+    :return: (dataset, changed)
+    """
+    raw = _read_bytes(source)
+    key = cache_key("update", dataset.key, content_hash(raw))
+    updated, changed = dataset.update(pd.read_csv(io.BytesIO(raw)), key)
+    return _datasets.get_or_build(key, lambda: updated), changed
+
+
+def dataset_stats():
+    """Content key, holding sessions and bytes of every loaded dataset, see ContentCache.stats."""
+    return _datasets.stats()
+
+
+def clear_datasets():
+    _datasets.clear()
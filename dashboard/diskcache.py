@@ -0,0 +1,272 @@
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from threading import Lock
+
+from plotly.utils import PlotlyJSONEncoder
+
+from .timing import stage
+
+
+# Location and size limit of the cache, overridable through the environment.
+# Setting NDMC_CACHE_DIR to an empty string disables the disk cache.
+CACHE_DIR = os.environ.get("NDMC_CACHE_DIR", ".ndmc_cache")
+MAX_CACHE_BYTES = int(os.environ.get("NDMC_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# Size limit of the serialized figures kept in memory for every session of
+# the process. Setting NDMC_FIGURE_CACHE_BYTES to 0 disables it.
+MAX_FIGURE_BYTES = int(os.environ.get("NDMC_FIGURE_CACHE_BYTES", 64 * 1024 * 1024))
+
+# Share of the disk cache's size limit left free after an eviction
+EVICT_HEADROOM = 0.1
+
+
+# Format of everything stored under a cache_key. Entries stay on disk across
+# deploys, so bump it whenever the same inputs start giving different output
+# (figure layout, polygons, snapshot layout); older entries are then ignored
+# and age out of the cache.
+CACHE_VERSION = 1
+
+
+def cache_key(*parts):
+    """Stable hash of CACHE_VERSION, input file hashes and render parameters."""
+    return hashlib.sha1(repr((CACHE_VERSION,) + parts).encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """
+    Directory of cached artifacts shared by every worker and kept across restarts.
+    :param directory: Cache directory, created on first write.
+    :param max_bytes: Total size above which the least recently used files are removed.
+
+    The total size is counted once from the directory and then kept up to
+    date by each write, so the directory is only walked again when it goes
+    over ``max_bytes`` (the walk also counts the writes of other workers).
+    Eviction then frees EVICT_HEADROOM of the limit, so that the next walk
+    is many writes away.
+    """
+
+    def __init__(self, directory, max_bytes=MAX_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = Lock()
+        self._bytes = None
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, key[:2], key + suffix)
+
+    def get_path(self, key, suffix):
+        """Path of the file stored under ``key``, or None. Counts as a use for eviction."""
+        path = self._path(key, suffix)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def get_bytes(self, key, suffix):
+        path = self.get_path(key, suffix)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put_bytes(self, key, suffix, data):
+        path = self._path(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            replaced = os.stat(path).st_size
+        except OSError:
+            replaced = 0
+        # Write then rename so other workers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += len(data) - replaced
+                if self._bytes <= self.max_bytes:
+                    return path
+        self._evict(keep=path)
+        return path
+
+    def _evict(self, keep=None):
+        """
+        Walks the directory and, above ``max_bytes``, removes the least
+        recently used files until EVICT_HEADROOM of it is free.
+        """
+        with self._lock:
+            entries = []
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * (1 - EVICT_HEADROOM) if total > self.max_bytes else total
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+            self._bytes = total
+
+    def get_figure(self, key):
+        """Returns the figure dict stored under ``key``, or None."""
+        data = self.get_bytes(key, ".json")
+        return None if data is None else json.loads(data)
+
+    def put_figure(self, key, fig):
+        self.put_bytes(key, ".json", json.dumps(fig, cls=PlotlyJSONEncoder).encode("utf-8"))
+
+
+class FigureCache:
+    """
+    Process-wide LRU of serialized figures, bounded by their total size.
+    :param max_bytes: Total size above which the least recently used figures are dropped.
+
+    Figures are kept as JSON bytes rather than dicts, so their size is
+    exact and no session can change another session's figure.
+    """
+
+    def __init__(self, max_bytes=MAX_FIGURE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Returns the JSON bytes stored under ``key``, or None."""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def __contains__(self, key):
+        # Not counted as a hit or miss, and not a use for eviction
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key, data, cold=False):
+        """
+        Stores ``data`` under ``key``.
+        :param cold: Store it as the least recently used figure, for figures
+            built ahead of use: it is the first to be dropped unless it is
+            read before. A figure already stored keeps its place.
+        :return: Whether it was stored.
+        """
+        if len(data) > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self._entries:
+                if cold:
+                    return True
+                self._bytes -= len(self._entries.pop(key))
+            # Make room first, so that a cold figure does not drop itself
+            while self._bytes + len(data) > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+            self._entries[key] = data
+            self._bytes += len(data)
+            if cold:
+                self._entries.move_to_end(key, last=False)
+        return True
+
+    def stats(self):
+        """Entries, bytes and the hit, miss and eviction counts since start."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+_cache = DiskCache(CACHE_DIR) if CACHE_DIR else None
+_figures = FigureCache()
+
+
+def disk_cache():
+    """The process-wide disk cache, or None when disabled."""
+    return _cache
+
+
+def figure_cache():
+    """The process-wide in-memory FigureCache."""
+    return _figures
+
+
+def cached_figure(key, build):
+    """
+    Returns the figure dict for ``key``, building it only if no cache has it.
+    Looks in the in-memory FigureCache first, then on disk; a built figure
+    is serialized once and stored in both.
+    :param build: Called without arguments to build the figure dict.
+    """
+    with stage("figure_cache.get") as details:
+        data = _figures.get(key)
+        details["hit"] = "memory" if data is not None else False
+        if data is None and _cache is not None:
+            data = _cache.get_bytes(key, ".json")
+            if data is not None:
+                details["hit"] = "disk"
+                _figures.put(key, data)
+        if data is not None:
+            return json.loads(data)
+    with stage("figure_cache.build"):
+        fig = build()
+    with stage("figure_cache.put"):
+        data = json.dumps(fig, cls=PlotlyJSONEncoder).encode("utf-8")
+        _figures.put(key, data)
+        if _cache is not None:
+            _cache.put_bytes(key, ".json", data)
+    return fig
+
+
+def warm_figure(key, build):
+    """
+    Puts the figure for ``key`` into the FigureCache ahead of its use, read
+    from disk or built. It goes in as the least recently used figure, so
+    prefetching only drops figures that would have been dropped next anyway.
+    :return: Bytes added to the FigureCache; 0 if it held the figure already or it did not fit.
+    """
+    if key in _figures:
+        return 0
+    data = _cache.get_bytes(key, ".json") if _cache is not None else None
+    if data is None:
+        data = json.dumps(build(), cls=PlotlyJSONEncoder).encode("utf-8")
+        if _cache is not None:
+            _cache.put_bytes(key, ".json", data)
+    return len(data) if _figures.put(key, data, cold=True) else 0
@@ -0,0 +1,134 @@
+import argparse
+import importlib.util
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import plotly.io as pio
+
+from .datastore import load_dataset
+from .geostore import load_geometry
+from .map import MAP_LAYOUT, DiseaseMap
+from .map_percent import DiseasePercentMap
+from .svgmap import svg_map
+
+
+FORMATS = ("html", "png", "svg")
+KINDS = {"map": DiseaseMap, "percent": DiseasePercentMap}
+DEFAULT_COLOR_SCALE = ["#ff0000", "#0000ff"]
+MANIFEST_NAME = "manifest.json"
+
+
+def _init_worker(csv_path, geojson_path):
+    # Once per worker: the dataset is memory-mapped from the snapshot in the
+    # disk cache and the polygons decoded from the cached TopoJSON, both
+    # written by the parent before the pool starts
+    load_dataset(csv_path)
+    load_geometry(geojson_path)
+
+
+def export_one(csv_path, geojson_path, out_dir, kind, year, disease, color_scale, formats, svg_width):
+    """
+    Writes one map in every requested format.
+    :return: One manifest entry per written file.
+    """
+    start = time.perf_counter()
+    fig = None
+    if {"html", "png"} & set(formats):
+        fig = KINDS[kind]().figure(csv_path, geojson_path, year, disease, color_scale)
+    built = time.perf_counter()
+
+    entries = []
+    for fmt in formats:
+        path = os.path.join(out_dir, kind, f"{disease}_{year}.{fmt}")
+        write_start = time.perf_counter()
+        if fmt == "html":
+            pio.write_html(fig, path, include_plotlyjs="cdn", validate=False)
+        elif fmt == "png":
+            pio.write_image(fig, path, validate=False)
+        else:
+            svg = svg_map(
+                load_dataset(csv_path), load_geometry(geojson_path), year, disease, color_scale,
+                width=svg_width, percent=kind == "percent",
+            )
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(svg)
+        entries.append({
+            "path": os.path.relpath(path, out_dir),
+            "kind": kind,
+            "year": year,
+            "disease": disease,
+            "format": fmt,
+            "bytes": os.path.getsize(path),
+            "figure_seconds": 0.0 if fmt == "svg" else built - start,
+            "write_seconds": time.perf_counter() - write_start,
+            "worker": os.getpid(),
+        })
+    return entries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Export every year x disease map as HTML, PNG or SVG without Streamlit."
+    )
+    parser.add_argument("csv_path", help="Wide disease CSV or snapshot")
+    parser.add_argument("geojson_path", help="GeoJSON with the state polygons")
+    parser.add_argument("--out", default="exports", help="Output directory (default: exports)")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=["html"])
+    parser.add_argument("--kinds", nargs="+", choices=sorted(KINDS), default=sorted(KINDS))
+    parser.add_argument("--colors", nargs="+", default=DEFAULT_COLOR_SCALE, help="Color scale, e.g. '#ff0000' '#0000ff'")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (default: CPU count)")
+    parser.add_argument("--svg-width", type=int, default=MAP_LAYOUT["width"], help="Width of SVG maps in pixels")
+    args = parser.parse_args(argv)
+
+    if "png" in args.formats and importlib.util.find_spec("kaleido") is None:
+        parser.error("PNG export needs the kaleido package (pip install kaleido)")
+
+    start = time.perf_counter()
+    # Parse once here so the workers find the snapshot and TopoJSON in the disk cache
+    dataset = load_dataset(args.csv_path)
+    geometry = load_geometry(args.geojson_path)
+    geometry.topology(geometry.level_for(MAP_LAYOUT["width"]))
+    geometry.topology(geometry.level_for(args.svg_width))
+
+    for kind in args.kinds:
+        os.makedirs(os.path.join(args.out, kind), exist_ok=True)
+    jobs = [
+        (kind, year, disease)
+        for kind in args.kinds for disease in dataset.diseases for year in dataset.years
+    ]
+    files = []
+    with ProcessPoolExecutor(
+        max_workers=args.workers, initializer=_init_worker, initargs=(args.csv_path, args.geojson_path)
+    ) as pool:
+        futures = [
+            pool.submit(
+                export_one, args.csv_path, args.geojson_path, args.out, kind, year, disease,
+                args.colors, args.formats, args.svg_width,
+            )
+            for kind, year, disease in jobs
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            entries = future.result()
+            files.extend(entries)
+            print(f"[{done}/{len(jobs)}] " + ", ".join(entry["path"] for entry in entries))
+
+    files.sort(key=lambda entry: entry["path"])
+    manifest = {
+        "csv_path": args.csv_path,
+        "geojson_path": args.geojson_path,
+        "dataset": dataset.key,
+        "geometry": geometry.key,
+        "color_scale": args.colors,
+        "workers": args.workers,
+        "seconds": time.perf_counter() - start,
+        "files": files,
+    }
+    with open(os.path.join(args.out, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Wrote {len(files)} files and {MANIFEST_NAME} to {args.out} in {manifest['seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+from collections import OrderedDict
+from threading import Lock
+
+import plotly.graph_objects as go
+
+
+# Number of base figures kept in memory at once
+MAX_TEMPLATES = 16
+
+
+class ChoroplethTemplate:
+    """
+    Choropleth figure built once per (geometry, color scale, layout).
+    :param geometry: StateGeometry providing the polygons.
+    :param color_scale: List of colors for the continuous color axis.
+    :param layout: Layout properties shared by every render.
+    :param label_font: Font of the state label trace.
+    :param color_label: Name of the color value in the hover box and color bar.
+    :param level: Simplification level of the polygons, see StateGeometry.level_for.
+
+    The GeoJSON is serialized once and shared by reference between the
+    figures returned by render(), which only fill in the per-render values.
+    """
+
+    def __init__(self, geometry, color_scale, layout, label_font=None, color_label="Number of Cases", level=0):
+        fig = go.Figure()
+        fig.add_choropleth(
+            geojson=geometry.geojson(level),
+            coloraxis="coloraxis",
+            hovertemplate="<b>%{hovertext}</b><br><br>" + color_label + "=%{z}<extra></extra>",
+        )
+        fig.add_scattergeo(mode="text", showlegend=False, textfont=label_font)
+        fig.update_geos(fitbounds="locations", visible=False)
+        fig.update_layout(
+            coloraxis=dict(colorscale=color_scale, colorbar=dict(title=dict(text=color_label))),
+            **layout,
+        )
+        base = fig.to_plotly_json()
+        self._choropleth, self._labels = base["data"]
+        self._layout = base["layout"]
+
+    def render(self, frame, title, labels=None, hover_name="NAME_1", color="Cases"):
+        """
+        Returns the figure dict for one joined frame.
+        :param frame: Frame returned by StateGeometry.join (index = feature position).
+        :param title: Title text.
+        :param labels: (lon, lat, text) arrays from labels.label_points, or None.
+        """
+        choropleth = dict(
+            self._choropleth,
+            locations=frame.index.astype(str).tolist(),
+            z=frame[color].tolist(),
+            hovertext=frame[hover_name].tolist(),
+        )
+        lon, lat, text = labels if labels is not None else ([], [], [])
+        label_trace = dict(self._labels, lon=list(lon), lat=list(lat), text=list(text))
+        layout = dict(self._layout, title=dict(self._layout.get("title", {}), text=title))
+        return {"data": [choropleth, label_trace], "layout": layout}
+
+
+class LRUCache:
+    """
+    Thread-safe map of at most ``max_entries`` values, least recently used dropped first.
+    Used for the figure templates, which are built once per geometry and parameters.
+    """
+
+    def __init__(self, max_entries):
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get_or_build(self, key, build):
+        """Returns the entry for ``key``, calling build() to create it on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        # Built outside the lock; of concurrent builds of a key the first stored wins
+        value = build()
+        with self._lock:
+            value = self._entries.setdefault(key, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+
+_templates = LRUCache(MAX_TEMPLATES)
+
+
+class ValidatedFigure(go.Figure):
+    """
+    Wraps a figure dict so that st.plotly_chart serializes it as it is.
+    :param fig: Figure dict, e.g. from cached_figure.
+
+    st.plotly_chart validates a plain dict by building a go.Figure from
+    it, which takes several times longer than serializing it. Our figure
+    dicts come from go.Figure templates with only the data values filled
+    in, so they are valid already. Only the serialization methods see the
+    dict (``data`` and ``layout`` stay empty); use it just for plotting.
+    """
+
+    def __init__(self, fig):
+        super().__init__()
+        self._fig = fig
+
+    def to_dict(self):
+        return self._fig
+
+    def to_plotly_json(self):
+        return self._fig
+
+
+def choropleth_template(geometry, color_scale, name, layout, level=0, **kwargs):
+    """
+    Returns the cached template for a geometry, simplification level, color scale and named layout.
+    :param name: Identifies ``layout`` (and kwargs) in the cache key, e.g. "map".
+    """
+    return _templates.get_or_build(
+        (geometry.key, level, tuple(color_scale), name),
+        lambda: ChoroplethTemplate(geometry, color_scale, layout, level=level, **kwargs),
+    )
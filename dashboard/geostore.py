@@ -0,0 +1,280 @@
+import io
+import json
+from threading import Lock
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from .datastore import ContentCache
+from .diskcache import cache_key, disk_cache
+from .topology import QUANTIZATION, decode, encode
+
+
+# Number of parsed geometry files kept in memory once no session uses them
+MAX_GEOMETRIES = 4
+
+# Rough size of one point of the decoded TopoJSON and GeoJSON dicts: two
+# floats, the list holding them and its slot in the list of points
+DECODED_POINT_BYTES = 2 * 24 + 72 + 8
+
+# Ways of placing a label inside a feature
+ANCHOR_METHODS = {
+    "centroid": shapely.centroid,
+    # Always inside the polygon, unlike the centroid of concave or multipart shapes
+    "representative": shapely.point_on_surface,
+}
+
+# Simplification levels as tolerances relative to the larger side of the
+# bounding box. Level 0 keeps every vertex; a level looks exact as long as
+# its tolerance stays under one rendered pixel (1 / width).
+SIMPLIFY_LEVELS = (0.0, 1 / 4000, 1 / 1500, 1 / 500)
+
+
+def normalize_name(name):
+    """Case, spacing and "&" insensitive form of a state name used for joins."""
+    return " ".join(str(name).replace("&", "and").split()).casefold()
+
+
+class StateGeometry:
+    """
+    Parsed GeoJSON for one file with a state name -> feature position index.
+    :param key: Content hash of the raw GeoJSON bytes.
+    :param source: GeoDataFrame, or the raw GeoJSON bytes to parse on first use.
+    :param name_column: Property holding the state name.
+
+    Parsing is deferred so that renders served from the figure cache never
+    read the file. ``gdf`` is shared between reruns and sessions, so treat
+    it as read-only.
+    """
+
+    def __init__(self, key, source, name_column="NAME_1"):
+        self.key = key
+        self.name_column = name_column
+        self._source = source
+        self._gdf = None
+        self._lock = Lock()
+        self._alignments = {}
+        self._anchors = {}
+        self._areas = None
+        self._simplified = {}
+        self._topologies = {}
+        self._geojson = {}
+        self._geojson_sizes = {}
+
+    @property
+    def gdf(self):
+        if self._gdf is None:
+            with self._lock:
+                if self._gdf is None:
+                    self._parse()
+        return self._gdf
+
+    def _parse(self):
+        gdf = self._source
+        if not isinstance(gdf, gpd.GeoDataFrame):
+            gdf = gpd.read_file(io.BytesIO(gdf))
+        gdf[self.name_column] = gdf[self.name_column].str.strip()
+        self._names = gdf[self.name_column].tolist()
+        self._name_index = {}
+        for position, name in enumerate(self._names):
+            self._name_index.setdefault(normalize_name(name), []).append(position)
+        self._source = None
+        self._gdf = gdf
+
+    @property
+    def names(self):
+        """Feature names in file order."""
+        self.gdf
+        return self._names
+
+    @property
+    def name_index(self):
+        """Normalized feature name -> positions in the file of every feature with that name."""
+        self.gdf
+        return self._name_index
+
+    @property
+    def nbytes(self):
+        """
+        Estimated bytes held: the raw GeoJSON until it is parsed, then the
+        polygons of every level built so far and their decoded TopoJSON and GeoJSON.
+        """
+        if self._gdf is None:
+            return len(self._source) if isinstance(self._source, bytes) else 0
+        size = int(self._gdf.drop(columns=self._gdf.geometry.name).memory_usage(deep=True).sum())
+        size += 16 * int(shapely.get_num_coordinates(np.asarray(self._gdf.geometry.values)).sum())
+        for level, geometries in self._simplified.items():
+            points = int(shapely.get_num_coordinates(geometries).sum())
+            if level:
+                size += 16 * points
+            size += DECODED_POINT_BYTES * points * ((level in self._topologies) + (level in self._geojson))
+        return size
+
+    def simplified(self, level=0):
+        """
+        Geometries in feature order at a level of SIMPLIFY_LEVELS, computed once per level.
+        Shared borders are simplified once for both neighbours (coverage
+        simplification), so states keep meeting without gaps or overlaps.
+        """
+        geometries = self._simplified.get(level)
+        if geometries is None:
+            geometries = np.asarray(self.gdf.geometry.values)
+            if level:
+                minx, miny, maxx, maxy = self.gdf.total_bounds
+                tolerance = SIMPLIFY_LEVELS[level] * max(maxx - minx, maxy - miny)
+                if hasattr(shapely, "coverage_simplify"):
+                    geometries = shapely.coverage_simplify(geometries, tolerance)
+                else:
+                    # GEOS < 3.12: per feature, so neighbours may no longer line up exactly
+                    geometries = shapely.simplify(geometries, tolerance, preserve_topology=True)
+            self._simplified[level] = geometries
+        return geometries
+
+    def topology(self, level=0):
+        """
+        Quantized TopoJSON of simplified(level) with shared borders stored once,
+        see topology.encode. Built once per level and kept in the disk cache,
+        so restarts and other workers skip the simplification.
+        """
+        topology = self._topologies.get(level)
+        if topology is None:
+            disk = disk_cache()
+            key = cache_key("topology", self.key, SIMPLIFY_LEVELS[level], QUANTIZATION)
+            data = disk.get_bytes(key, ".topojson") if disk is not None else None
+            if data is None:
+                topology = encode(self.simplified(level))
+                if disk is not None:
+                    disk.put_bytes(key, ".topojson", json.dumps(topology, separators=(",", ":")).encode("utf-8"))
+            else:
+                topology = json.loads(data)
+            self._topologies[level] = topology
+        return topology
+
+    def geojson(self, level=0):
+        """
+        GeoJSON dict of the polygons whose feature ids are the positions in the file,
+        matching the index of join(). Decoded from topology(level), so the
+        coordinates are quantized to a few decimals. Built once per
+        simplification level and shared; do not modify.
+        """
+        if level not in self._geojson:
+            features = [
+                {"id": str(position), "type": "Feature", "properties": {}, "geometry": geometry}
+                for position, geometry in enumerate(decode(self.topology(level)))
+            ]
+            self._geojson[level] = {"type": "FeatureCollection", "features": features}
+        return self._geojson[level]
+
+    def geojson_size(self, level=0):
+        """Size in bytes of the compact JSON of geojson(level)."""
+        if level not in self._geojson_sizes:
+            self._geojson_sizes[level] = len(json.dumps(self.geojson(level), separators=(",", ":")))
+        return self._geojson_sizes[level]
+
+    def level_for(self, width=None, max_bytes=None):
+        """
+        Picks a simplification level for a map drawn ``width`` pixels wide:
+        the coarsest one that still looks exact, then coarser ones until the
+        GeoJSON fits in ``max_bytes``. Without either, level 0.
+        """
+        level = 0
+        if width:
+            level = max(i for i, tolerance in enumerate(SIMPLIFY_LEVELS) if tolerance <= 1 / width)
+        if max_bytes:
+            while level < len(SIMPLIFY_LEVELS) - 1 and self.geojson_size(level) > max_bytes:
+                level += 1
+        return level
+
+    def areas(self):
+        """Area of every feature in feature order, in the file's coordinate units."""
+        if self._areas is None:
+            self._areas = shapely.area(np.asarray(self.gdf.geometry.values))
+            self._areas.setflags(write=False)
+        return self._areas
+
+    def anchors(self, method="representative"):
+        """
+        Label positions of every feature as read-only (lon, lat) arrays in feature order.
+        Computed once per method.
+        :param method: "centroid" or "representative".
+        """
+        if method not in self._anchors:
+            points = ANCHOR_METHODS[method](np.asarray(self.gdf.geometry.values))
+            lon, lat = shapely.get_x(points), shapely.get_y(points)
+            lon.setflags(write=False)
+            lat.setflags(write=False)
+            self._anchors[method] = (lon, lat)
+        return self._anchors[method]
+
+    def align(self, states):
+        """
+        For each feature, the position of its row in ``states`` or -1 if it has none.
+        Computed once per list of states.
+        """
+        key = tuple(states)
+        rows = self._alignments.get(key)
+        if rows is None:
+            rows = np.full(len(self.names), -1, dtype=np.intp)
+            for row, state in enumerate(states):
+                # A state drawn as several features gets its row in each of them
+                for position in self.name_index.get(normalize_name(state), ()):
+                    if rows[position] < 0:
+                        rows[position] = row
+            rows.setflags(write=False)
+            self._alignments[key] = rows
+        return rows
+
+    def scatter(self, states, values, fill=np.nan):
+        """Places per-state ``values`` into feature order, ``fill`` where a feature has no state."""
+        rows = self.align(states)
+        matched = rows >= 0
+        out = np.full(len(rows), fill, dtype=float)
+        out[matched] = np.asarray(values)[rows[matched]]
+        return out
+
+    def join(self, dataset, year, disease, how="inner", with_geometry=True):
+        """
+        GeoDataFrame of the features with the dataset's (year, disease) slice attached.
+        Equivalent to ``gdf.merge(slice, left_on=NAME_1, right_on="States/UTs")``
+        but uses the precomputed index instead of a merge. The index is the
+        feature position in the file.
+        :param how: "inner" drops features without data, "left" keeps them with NaN.
+        :param with_geometry: If False, returns a plain DataFrame without the polygons.
+        """
+        rows = self.align(dataset.cube.states)
+        data = dataset.slice(year, disease).reset_index(drop=True)
+        if how == "inner":
+            keep = (rows >= 0) & (len(data) > 0)
+        else:
+            keep = np.ones(len(rows), dtype=bool)
+        if with_geometry:
+            frame = self.gdf[keep].copy()
+        else:
+            frame = self.gdf.loc[keep, [self.name_column]].copy()
+        data = data.reindex(rows[keep]).set_axis(frame.index)
+        for column in data.columns:
+            frame[column] = data[column]
+        return frame
+
+
+_geometries = ContentCache(StateGeometry, MAX_GEOMETRIES)
+
+
+def load_geometry(source, holder=None):
+    """
+    Returns the parsed geometry for a GeoJSON path, uploaded buffer or DataSource.
+    Identical contents share one StateGeometry across reruns and sessions.
+    :param source: File path, file-like object or DataSource with the GeoJSON.
+    :param holder: SessionHandle of the session using the geometry, see load_dataset.
+    """
+    return _geometries.load(source, holder)
+
+
+def geometry_stats():
+    """Content key, holding sessions and bytes of every loaded geometry, see ContentCache.stats."""
+    return _geometries.stats()
+
+
+def clear_geometries():
+    _geometries.clear()
@@ -1,215 +1,163 @@
+import math
+
+import numpy as np
 import pandas as pd
-import geopandas as gpd
-import plotly.express as px
 import streamlit as st
+from plotly.colors import make_colorscale
+from plotly.subplots import make_subplots
+
+from .datastore import load_dataset
+from .diskcache import cache_key, cached_figure
+from .figures import LRUCache, ValidatedFigure
+from .geostore import load_geometry
+from .timing import stage
+
+
+# Panels per row and size of each panel in pixels
+GRID_COLUMNS = 4
+PANEL_SIZE = 300
+
+# Number of grid layouts kept in memory at once
+MAX_LAYOUTS = 16
+
+# Default size limit of the polygons of all panels together. Every panel
+# carries its own copy, so more panels get coarser polygons.
+GRID_GEOMETRY_BYTES = 256 * 1024
+
+
+def grid_panels(dataset, geometry, years, disease):
+    """
+    Cases, hover texts and total cases of the panels of ``years``, for all years at once.
+    Cases and texts are Year x feature arrays in file order; states
+    without data show 0 cases.
+    """
+    cube = dataset.cube
+    rows = geometry.align(cube.states)
+    matched = rows >= 0
+    cases = np.zeros((len(years), len(rows)), dtype=np.int64)
+    if disease in cube.disease_index:
+        y = [cube.year_index[str(year)] for year in years]
+        d = cube.disease_index[disease]
+        values = np.where(cube.observed[y, d], cube.values[y, d], 0)
+        cases[:, matched] = values[:, rows[matched]]
+
+    # Short form of the state, or the feature name where it has none
+    names = np.asarray(geometry.names, dtype=object)
+    short = names.copy()
+    if "Short Form" in dataset.id_columns:
+        short[matched] = dataset.ids["Short Form"].to_numpy(dtype=object)[rows[matched]]
+        short = np.where(pd.isna(short), names, short)
+    texts = np.char.add(np.char.add(short.astype(str), "<br>Cases: "), cases.astype(str))
+    totals = [dataset.aggregates.total(year, disease) for year in years]
+    return cases, texts, totals
+
+
+_layouts = LRUCache(MAX_LAYOUTS)
+
+
+def grid_layout(panels, columns=GRID_COLUMNS):
+    """
+    Layout of a grid of ``panels`` maps, built once per grid shape.
+    Titles and the color scale are placeholders that grid_figure fills
+    in; the layout is shared, so do not modify it.
+    """
+    columns = min(columns, panels)
+    return _layouts.get_or_build((panels, columns), lambda: _build_grid_layout(panels, columns))
+
+
+def _build_grid_layout(panels, columns):
+    rows = math.ceil(panels / columns)
+    fig = make_subplots(
+        rows=rows,
+        cols=columns,
+        specs=[[{"type": "geo"}] * columns for _ in range(rows)],
+        subplot_titles=["Title"] * panels,
+        horizontal_spacing=0.01,
+        vertical_spacing=0.08 / rows,
+    )
+    fig.update_geos(fitbounds="locations", visible=False)
+    fig.update_annotations(font=dict(size=16, family="Arial Black, Arial, sans-serif", color="black"))
+    fig.update_layout(
+        title=dict(text="", x=0.5, xanchor="center"),
+        coloraxis=dict(colorbar=dict(title=dict(text="Cases"))),
+        margin=dict(l=20, r=20, t=60, b=20),
+        height=PANEL_SIZE * rows + 80,
+    )
+    return fig.layout.to_plotly_json()
+
+
+def grid_figure(geometry, years, panels, disease, color_scale, columns=GRID_COLUMNS, max_geometry_bytes=None):
+    """
+    One figure with a map per year sharing a single color axis.
+    :param panels: (cases, texts, totals) of the years as returned by grid_panels.
+    :param max_geometry_bytes: Size limit of the polygons of all panels together,
+        GRID_GEOMETRY_BYTES by default.
+    """
+    cases, texts, totals = panels
+    base = grid_layout(len(years), columns)
+    layout = dict(
+        base,
+        annotations=[
+            dict(annotation, text=f"{year} - Total Cases: {total:,.0f}")
+            for annotation, year, total in zip(base["annotations"], years, totals)
+        ],
+        title=dict(base["title"], text=f"{disease} Cases"),
+        coloraxis=dict(base["coloraxis"], colorscale=make_colorscale(color_scale)),
+    )
+
+    # The panels share one GeoJSON object instead of one copy per map, simplified
+    # as far as is invisible at the panel size. It is still written once per
+    # panel, so the budget per panel shrinks as the panels add up.
+    budget = (max_geometry_bytes or GRID_GEOMETRY_BYTES) // len(years)
+    geojson = geometry.geojson(geometry.level_for(PANEL_SIZE, budget))
+    locations = [str(position) for position in range(len(geometry.names))]
+    data = []
+    for i in range(len(years)):
+        data.append({
+            "type": "choropleth",
+            "geo": "geo" if i == 0 else f"geo{i + 1}",
+            "geojson": geojson,
+            "locations": locations,
+            "z": cases[i].tolist(),
+            "coloraxis": "coloraxis",
+            "hovertext": geometry.names,
+            "customdata": texts[i].tolist(),
+            "hovertemplate": "<b>%{hovertext}</b><br><br>%{customdata}<extra></extra>",
+        })
+    return {"data": data, "layout": layout}
 
 
 class GridMap:
     def __init__(self):
         pass
 
-    def __call__(self, csv_path, geojson_path, start_year, end_year, disease, color_scale):
+    def __call__(self, csv_path, geojson_path, start_year, end_year, disease, color_scale, max_geometry_bytes=None):
         # Load data
-        data = pd.read_csv(csv_path)
-        data["States/UTs"] = data["States/UTs"].str.strip()
-        data["Short Form"] = data["Short Form"].str.strip()
-        gdf = gpd.read_file(geojson_path)
-        gdf["NAME_1"] = gdf["NAME_1"].str.strip()
-
-        # Melt and preprocess data
-        data_melted = data.melt(
-            id_vars=["States/UTs", "Short Form"], var_name="Year-Disease", value_name="Cases"
-        )
-        data_melted[["Year", "Disease"]] = data_melted["Year-Disease"].str.split("-", expand=True)
-        data_melted.drop(columns=["Year-Disease"], inplace=True)
-
-        # Generate 4 evenly spaced years within the range
-        try:
-            year_range = ["2008","2009","2010","2011"]
-            # selected_years = sorted(set(year_range))  # Ensure uniqueness
-            # selected_years = list(map(str, sorted(selected_years[:4])))  # Take up to 4 years as strings
-        except Exception as e:
-            st.error(f"Error processing year range: {e}")
-            return
-
-        # List to hold the maps
-        maps = []
-
-        
-        filtered_data = gdf.merge(
-                    data_melted[(data_melted["Year"] == "2008") & (data_melted["Disease"] == disease)],
-                    left_on="NAME_1",
-                    right_on="States/UTs",
-                    how="left"
-                )
-
-                # Handle missing cases
-        filtered_data["Cases"].fillna(0, inplace=True)
-
-        total_cases = filtered_data["Cases"].sum()
-
-                # Add text for hover information
-        filtered_data["text"] = (
-                    filtered_data["Short Form"] + "<br>Cases: " + filtered_data["Cases"].astype(int).astype(str)
-                )
-
-                # Create a map for the year
-        fig = px.choropleth(
-                    filtered_data,
-                    geojson=filtered_data.geometry,
-                    locations=filtered_data.index,
-                    color="Cases",
-                    title=f"{disease} Cases in {"2008"} - Total Cases: {total_cases:,}",
-                    color_continuous_scale=color_scale,
-                    hover_name="NAME_1",
-                    hover_data={"text": True, "Cases": False},
-                )
-        fig.update_geos(
-                    fitbounds="locations",
-                    visible=False,
-                )
-        fig.update_layout(
-                    title_font=dict(size=16, family="Arial Black, Arial, sans-serif", color="black"),
-                    geo=dict(fitbounds="locations", visible=False),
-                    margin=dict(l=20, r=20, t=60, b=20),
-                    height=300,  # Height of each map
-                    width=300,   # Width of each map
-                )
-
-        maps.append(fig)
-        filtered_data = gdf.merge(
-                    data_melted[(data_melted["Year"] == "2009") & (data_melted["Disease"] == disease)],
-                    left_on="NAME_1",
-                    right_on="States/UTs",
-                    how="left"
-                )
-
-                # Handle missing cases
-        filtered_data["Cases"].fillna(0, inplace=True)
-
-        total_cases = filtered_data["Cases"].sum()
-
-                # Add text for hover information
-        filtered_data["text"] = (
-                    filtered_data["Short Form"] + "<br>Cases: " + filtered_data["Cases"].astype(int).astype(str)
-                )
-
-                # Create a map for the year
-        fig = px.choropleth(
-                    filtered_data,
-                    geojson=filtered_data.geometry,
-                    locations=filtered_data.index,
-                    color="Cases",
-                    title=f"{disease} Cases in {"2009"} - Total Cases: {total_cases:,}",
-                    color_continuous_scale=color_scale,
-                    hover_name="NAME_1",
-                    hover_data={"text": True, "Cases": False},
-                )
-        fig.update_geos(
-                    fitbounds="locations",
-                    visible=False,
-                )
-        fig.update_layout(
-                    title_font=dict(size=16, family="Arial Black, Arial, sans-serif", color="black"),
-                    geo=dict(fitbounds="locations", visible=False),
-                    margin=dict(l=20, r=20, t=60, b=20),
-                    height=300,  # Height of each map
-                    width=300,   # Width of each map
-                )
-
-        maps.append(fig)
-        filtered_data = gdf.merge(
-                    data_melted[(data_melted["Year"] == "2010") & (data_melted["Disease"] == disease)],
-                    left_on="NAME_1",
-                    right_on="States/UTs",
-                    how="left"
-                )
-
-                # Handle missing cases
-        filtered_data["Cases"].fillna(0, inplace=True)
-
-        total_cases = filtered_data["Cases"].sum()
-
-                # Add text for hover information
-        filtered_data["text"] = (
-                    filtered_data["Short Form"] + "<br>Cases: " + filtered_data["Cases"].astype(int).astype(str)
-                )
-
-                # Create a map for the year
-        fig = px.choropleth(
-                    filtered_data,
-                    geojson=filtered_data.geometry,
-                    locations=filtered_data.index,
-                    color="Cases",
-                    title=f"{disease} Cases in {"2010"} - Total Cases: {total_cases:,}",
-                    color_continuous_scale=color_scale,
-                    hover_name="NAME_1",
-                    hover_data={"text": True, "Cases": False},
-                )
-        fig.update_geos(
-                    fitbounds="locations",
-                    visible=False,
-                )
-        fig.update_layout(
-                    title_font=dict(size=16, family="Arial Black, Arial, sans-serif", color="black"),
-                    geo=dict(fitbounds="locations", visible=False),
-                    margin=dict(l=20, r=20, t=60, b=20),
-                    height=300,  # Height of each map
-                    width=300,   # Width of each map
-                )
-
-        maps.append(fig)
-        filtered_data = gdf.merge(
-                    data_melted[(data_melted["Year"] == "2011") & (data_melted["Disease"] == disease)],
-                    left_on="NAME_1",
-                    right_on="States/UTs",
-                    how="left"
-                )
-
-                # Handle missing cases
-        filtered_data["Cases"].fillna(0, inplace=True)
-
-        total_cases = filtered_data["Cases"].sum()
-
-                # Add text for hover information
-        filtered_data["text"] = (
-                    filtered_data["Short Form"] + "<br>Cases: " + filtered_data["Cases"].astype(int).astype(str)
-                )
-
-                # Create a map for the year
-        fig = px.choropleth(
-                    filtered_data,
-                    geojson=filtered_data.geometry,
-                    locations=filtered_data.index,
-                    color="Cases",
-                    title=f"{disease} Cases in {"2011"} - Total Cases: {total_cases:,}",
-                    color_continuous_scale=color_scale,
-                    hover_name="NAME_1",
-                    hover_data={"text": True, "Cases": False},
-                )
-        fig.update_geos(
-                    fitbounds="locations",
-                    visible=False,
-                )
-        fig.update_layout(
-                    title_font=dict(size=16, family="Arial Black, Arial, sans-serif", color="black"),
-                    geo=dict(fitbounds="locations", visible=False),
-                    margin=dict(l=20, r=20, t=60, b=20),
-                    height=300,  # Height of each map
-                    width=300,   # Width of each map
-                )
-
-        maps.append(fig)
-        # Check if at least one map is created
-        if not maps:
+        with stage("grid.load"):
+            dataset = load_dataset(csv_path)
+            geometry = load_geometry(geojson_path)
+
+        # Every year of the data inside the selected range
+        years = [
+            year for year in dataset.cube.years
+            if int(start_year) <= int(year) <= int(end_year)
+        ]
+        if not years:
             st.error("No maps could be created. Please check your data or inputs.")
             return
 
-        # Render the 4 maps side by side
-        # col1, col2, col3, col4 = st.columns(4)
-        print(len(maps))
-        
-        st.plotly_chart(maps[0], use_container_width=True)
-        st.plotly_chart(maps[1], use_container_width=True)
-        st.plotly_chart(maps[2], use_container_width=True)
-        st.plotly_chart(maps[3], use_container_width=True)
+        def build():
+            with stage("grid.panels", panels=len(years)):
+                panels = grid_panels(dataset, geometry, years, disease)
+            with stage("grid.subplots"):
+                return grid_figure(geometry, years, panels, disease, color_scale, max_geometry_bytes=max_geometry_bytes)
+
+        # Figures are kept on disk across restarts, keyed by the panels' slices and parameters
+        slice_keys = tuple(dataset.slice_key(year, disease) for year in years)
+        key = cache_key(
+            "grid", slice_keys, geometry.key, tuple(years), disease, tuple(color_scale), max_geometry_bytes,
+        )
+        with stage("grid.figure"):
+            fig = cached_figure(key, build)
+        with stage("grid.plotly_chart"):
+            st.plotly_chart(ValidatedFigure(fig), use_container_width=True)
@@ -0,0 +1,31 @@
+import numpy as np
+
+
+def label_mask(frame, geometry, min_cases=None, min_area=None):
+    """
+    Which rows of a joined frame get a label.
+    :param frame: Frame returned by StateGeometry.join (index = feature position).
+    :param geometry: StateGeometry the frame was joined against.
+    :param min_cases: Hide labels of states with fewer cases.
+    :param min_area: Hide labels of features smaller than this, in the file's units
+        (square degrees for lon/lat GeoJSON).
+    """
+    cases = frame["Cases"].to_numpy(dtype=float)
+    keep = ~np.isnan(cases)
+    if min_cases is not None:
+        keep &= cases >= min_cases
+    if min_area is not None:
+        keep &= geometry.areas()[frame.index.to_numpy()] >= min_area
+    return keep
+
+
+def label_points(frame, geometry, text, anchor="representative", min_cases=None, min_area=None):
+    """
+    Returns the (lon, lat, text) arrays of the labels to draw for ``frame``.
+    :param text: Label per row of ``frame``.
+    :param anchor: Anchor method passed to StateGeometry.anchors.
+    """
+    keep = label_mask(frame, geometry, min_cases=min_cases, min_area=min_area)
+    positions = frame.index.to_numpy()[keep]
+    lon, lat = geometry.anchors(anchor)
+    return lon[positions], lat[positions], np.asarray(text, dtype=object)[keep]
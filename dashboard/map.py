@@ -1,97 +1,244 @@
-import pandas as pd
-import geopandas as gpd
-import plotly.express as px
 import streamlit as st
 
+from .datastore import load_dataset
+from .diskcache import cache_key, cached_figure
+from .figures import ValidatedFigure, choropleth_template
+from .geostore import load_geometry
+from .labels import label_points
+from .prefetch import prefetch_neighbours
+from .timing import stage
 
-class DiseaseMap:
-    def __init__(self):
-        pass
 
-    def __call__(self, csv_path, geojson_path, year, disease, color_scale):
-        # Load data
-        data = pd.read_csv(csv_path)
-        data["States/UTs"] = data["States/UTs"].str.strip()
-        data["Short Form"] = data["Short Form"].str.strip()
-        gdf = gpd.read_file(geojson_path)
-        gdf["NAME_1"] = gdf["NAME_1"].str.strip()
-
-        # Melt and preprocess data
-        data_melted = data.melt(
-            id_vars=["States/UTs", "Short Form"], var_name="Year-Disease", value_name="Cases"
-        )
-        data_melted[["Year", "Disease"]] = data_melted["Year-Disease"].str.split("-", expand=True)
-        data_melted.drop(columns=["Year-Disease"], inplace=True)
+MAP_LAYOUT = dict(
+    title={
+        "y": 0.95,  # Position closer to the top
+        "x": 0.5,   # Centered horizontally
+        "xanchor": "center",
+        "yanchor": "top",
+    },
+    title_font=dict(
+        size=22,       # Larger font size for better visibility
+        family="Arial, sans-serif",
+        color="black"
+    ),
+    margin=dict(
+        l=0, r=0, t=0, b=0  # Increase top margin for the title
+    ),
+    width=1200,   # Adjust the width as needed
+    height=1200   # Adjust the height as needed
+)
 
-        # Merge and filter data
-        merged = gdf.merge(
-            data_melted, left_on="NAME_1", right_on="States/UTs", how="left"
-        )
-        filtered_data = merged[(merged["Year"] == year) & (merged["Disease"] == disease)]
+LABEL_FONT = dict(family="Droid Sans, sans-serif", size=12, color="black")
+
+
+def timeline_figure(dataset, geometry, color_scale, year, disease, label_anchor="representative",
+                    label_min_cases=None, label_min_area=None, max_geometry_bytes=None):
+    """
+    One figure holding every year and disease of the dataset for in-browser exploration.
+    A slider steps through the years (one plotly frame per year and disease), a
+    menu switches disease and a second menu switches the labels between
+    absolute cases and percentages.
+    :param year: Year shown first.
+    :param disease: Disease shown first.
+    :param max_geometry_bytes: Size limit of the polygons, see StateGeometry.level_for.
+    """
+    template = choropleth_template(
+        geometry, color_scale, "map", MAP_LAYOUT,
+        level=geometry.level_for(MAP_LAYOUT["width"], max_geometry_bytes), label_font=LABEL_FONT,
+    )
+    years = dataset.cube.years
+    diseases = dataset.cube.diseases
+    year = str(year) if str(year) in years else years[0]
+    disease = disease if disease in diseases else diseases[0]
+
+    # Trace 0 is the choropleth, 1 the case labels and 2 the percent labels
+    views = {}
+    for d in diseases:
+        for y in years:
+            filtered_data = geometry.join(dataset, y, d, with_geometry=False)
+            total_cases = dataset.aggregates.total(y, d)
+            percent = round(filtered_data["Percent"], 2)
+            label_options = dict(anchor=label_anchor, min_cases=label_min_cases, min_area=label_min_area)
+            case_labels = label_points(
+                filtered_data, geometry,
+                filtered_data["Short Form"] + "<br>" + filtered_data["Cases"].astype(str),
+                **label_options
+            )
+            percent_labels = label_points(
+                filtered_data, geometry,
+                filtered_data["Short Form"] + "<br>" + percent.astype(str) + "%",
+                **label_options
+            )
+            title = f"{d} Cases in {y} - Total Cases: {total_cases:,}"
+            rendered = template.render(filtered_data, title=title, labels=case_labels)
+            if (d, y) == (disease, year):
+                fig = rendered
+
+            # Frames only carry what changes; the GeoJSON stays in the base trace
+            choropleth = rendered["data"][0]
+            data = [
+                {"type": "choropleth", "locations": choropleth["locations"],
+                 "z": choropleth["z"], "hovertext": choropleth["hovertext"]},
+            ]
+            for lon, lat, text in (case_labels, percent_labels):
+                data.append({"type": "scattergeo", "lon": list(lon), "lat": list(lat), "text": list(text)})
+            views[(d, y)] = (data, title)
+
+    def slider(d, active):
+        step_options = {"mode": "immediate", "frame": {"duration": 0, "redraw": True}, "transition": {"duration": 0}}
+        return {
+            "active": active,
+            "currentvalue": {"prefix": "Year: "},
+            "pad": {"t": 30},
+            "steps": [
+                {"label": y, "method": "animate", "args": [[f"{d}|{y}"], step_options]}
+                for y in years
+            ],
+        }
+
+    # Same color range for every year of a disease so years are comparable
+    cmax = {d: dataset.aggregates.peak(d) for d in diseases}
+
+    disease_buttons = []
+    for d in diseases:
+        # Switching disease jumps to its first year and swaps in its slider
+        (choropleth, cases, percent), title = views[(d, years[0])]
+        disease_buttons.append({
+            "label": d,
+            "method": "update",
+            "args": [
+                {
+                    "locations": [choropleth["locations"], None, None],
+                    "z": [choropleth["z"], None, None],
+                    "hovertext": [choropleth["hovertext"], None, None],
+                    "lon": [None, cases["lon"], percent["lon"]],
+                    "lat": [None, cases["lat"], percent["lat"]],
+                    "text": [None, cases["text"], percent["text"]],
+                },
+                {"sliders": [slider(d, 0)], "title.text": title, "coloraxis.cmax": cmax[d]},
+                [0, 1, 2],
+            ],
+        })
+    label_buttons = [
+        {"label": "Cases", "method": "restyle", "args": [{"visible": [True, False]}, [1, 2]]},
+        {"label": "Percent", "method": "restyle", "args": [{"visible": [False, True]}, [1, 2]]},
+    ]
+
+    percent = views[(disease, year)][0][2]
+    fig["data"].append(dict(fig["data"][1], visible=False, lon=percent["lon"], lat=percent["lat"], text=percent["text"]))
+    fig["frames"] = [
+        {"name": f"{d}|{y}", "data": data, "traces": [0, 1, 2], "layout": {"title": {"text": title}}}
+        for (d, y), (data, title) in views.items()
+    ]
+    fig["layout"] = dict(
+        fig["layout"],
+        sliders=[slider(disease, years.index(year))],
+        updatemenus=[
+            {"buttons": disease_buttons, "active": diseases.index(disease),
+             "x": 0, "y": 1, "xanchor": "left", "yanchor": "top"},
+            {"buttons": label_buttons, "type": "buttons", "direction": "right",
+             "x": 0.3, "y": 1, "xanchor": "left", "yanchor": "top"},
+        ],
+        coloraxis=dict(fig["layout"]["coloraxis"], cmin=0, cmax=cmax[disease]),
+    )
+    return fig
+
+
+def map_figure(dataset, geometry, year, disease, color_scale, label_anchor="representative",
+               label_min_cases=None, label_min_area=None, max_geometry_bytes=None):
+    """
+    Figure dict of the map for one year and disease.
+    :param max_geometry_bytes: Size limit of the polygons, see StateGeometry.level_for.
+    """
+    # Attach the (year, disease) slice of the cube; states without data are dropped
+    with stage("map.join"):
+        filtered_data = geometry.join(dataset, year, disease, with_geometry=False)
 
         # Add text for hover information
         filtered_data["text"] = (
             filtered_data["Short Form"] + "<br>" + filtered_data["Cases"].astype(str)
         )
 
-        
-        # Calculate total cases
-        total_cases = filtered_data["Cases"].sum()
+    # National total, precomputed once per dataset
+    total_cases = dataset.aggregates.total(year, disease)
 
-        # Plot the choropleth map with labels, featureidkey, and projection
-        fig = px.choropleth(
+    # Base figure is built once per geometry and color scale; only values change here.
+    # Polygons are simplified as far as is invisible at the map's width
+    with stage("map.template"):
+        template = choropleth_template(
+            geometry, color_scale, "map", MAP_LAYOUT,
+            level=geometry.level_for(MAP_LAYOUT["width"], max_geometry_bytes), label_font=LABEL_FONT,
+        )
+    with stage("map.labels"):
+        labels = label_points(
             filtered_data,
-                geojson=filtered_data.geometry,
-                locations=filtered_data.index,
-                color="Cases",
-                # title=f"{disease} Cases in {year}",
-                color_continuous_scale=color_scale,
-                hover_name="NAME_1",
-                labels={"Cases": "Number of Cases"},
-                title=f"{disease} Cases in {year} - Total Cases: {total_cases:,}"
+            geometry,
+            filtered_data["text"],
+            anchor=label_anchor,
+            min_cases=label_min_cases,
+            min_area=label_min_area,
         )
-        total_cases = 0
-            # Add text labels to each state
-        for i, row in filtered_data.iterrows():
-                total_cases += row["Cases"]
-                if pd.notna(row["Cases"]):
-                    fig.add_scattergeo(
-                        lon=[row.geometry.centroid.x],
-                        lat=[row.geometry.centroid.y],
-                        text=row["text"],
-                        mode="text",
-                        showlegend=False,
-                        textfont=dict(family="Droid Sans, sans-serif", size=12, color="black"),
-                    )
-
-        # Update map properties
-        fig.update_geos(
-            fitbounds="locations",
-            visible=False,
+    with stage("map.render"):
+        return template.render(
+            filtered_data,
+            title=f"{disease} Cases in {year} - Total Cases: {total_cases:,}",
+            labels=labels,
         )
-        # total_cases = sum()
-        fig.update_layout(
-            title={
-                "text": f"{disease} Cases in {year} - Total Cases: {total_cases:,}",
-                "y": 0.95,  # Position closer to the top
-                "x": 0.5,   # Centered horizontally
-                "xanchor": "center",
-                "yanchor": "top",
-            },
-            title_font=dict(
-                size=22,       # Larger font size for better visibility
-                family="Arial, sans-serif",
-                color="black"
-            ),
-            geo=dict(
-                fitbounds="locations",
-                visible=False
-            ),
-            margin=dict(
-                l=0, r=0, t=0, b=0  # Increase top margin for the title
-            ),
-            width=1200,   # Adjust the width as needed
-            height=1200   # Adjust the height as needed
+
+
+class DiseaseMap:
+    # Prefix of the stage timings and the figure cache keys
+    name = "map"
+
+    def __init__(self):
+        pass
+
+    def figure_builder(self, dataset, geometry, year, disease, color_scale, interactive=False, **options):
+        """
+        Build function of the figure and the key of the data it depends on.
+        Subclasses override this to draw a different figure with the same caching.
+        """
+        if interactive:
+            # Every year and disease in one figure; switching happens in the browser
+            build = lambda: timeline_figure(dataset, geometry, color_scale, year, disease, **options)
+            return build, dataset.key
+        # A single map only depends on its slice, so appending other years keeps it cached
+        build = lambda: map_figure(dataset, geometry, year, disease, color_scale, **options)
+        return build, dataset.slice_key(year, disease)
+
+    def figure_job(self, csv_path, geojson_path, year, disease, color_scale, label_anchor="representative",
+                   label_min_cases=None, label_min_area=None, interactive=False, max_geometry_bytes=None):
+        """Figure cache key and build function of the map, see figure()."""
+        # Load data
+        with stage(f"{self.name}.load"):
+            dataset = load_dataset(csv_path)
+            geometry = load_geometry(geojson_path)
+
+        options = dict(
+            label_anchor=label_anchor, label_min_cases=label_min_cases, label_min_area=label_min_area,
+            max_geometry_bytes=max_geometry_bytes,
+        )
+        build, data_key = self.figure_builder(dataset, geometry, year, disease, color_scale, interactive, **options)
+
+        # Figures are kept on disk across restarts, keyed by input hashes and parameters
+        key = cache_key(
+            self.name, data_key, geometry.key, str(year), disease, tuple(color_scale),
+            interactive, sorted(options.items()),
         )
+        return key, build
+
+    def figure(self, *args, **kwargs):
+        """Figure dict of the map, built or read from the figure cache. Does not need Streamlit."""
+        key, build = self.figure_job(*args, **kwargs)
+        with stage(f"{self.name}.figure"):
+            return cached_figure(key, build)
+
+    def __call__(self, *args, **kwargs):
+        fig = self.figure(*args, **kwargs)
+
         # Render the map in Streamlit
-        st.plotly_chart(fig,use_container_width=True)
+        with stage(f"{self.name}.plotly_chart"):
+            st.plotly_chart(ValidatedFigure(fig), use_container_width=True)
+
+        # Build the maps of the adjacent years and other diseases in the background
+        prefetch_neighbours(self.figure_job, *args, **kwargs)
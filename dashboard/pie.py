@@ -1,7 +1,23 @@
 import json
+import numpy as np
 from streamlit_elements import html, nivo, mui
 from .dashboard import Dashboard
-import pandas as pd
+from .datastore import load_dataset
+from .timing import stage
+
+def pie_data(cube, year, disease):
+    """Nivo pie slices, one per state, for one year and disease; NaN where the CSV had no value."""
+    if (str(year), disease) not in cube:
+        return []
+    y, d = cube.year_index[str(year)], cube.disease_index[disease]
+    cases, observed = cube.values[y, d], cube.observed[y, d]
+    # Same values read_csv would give: ints, or floats with NaN for gaps
+    cases = (cases if observed.all() else np.where(observed, cases, np.nan)).tolist()
+    return [
+        {"id": state, "label": state, "value": value}
+        for state, value in zip(cube.states, cases)
+    ]
+
 
 class DiseasePie(Dashboard.Item):
     def __init__(self, *args, **kwargs):
@@ -30,31 +46,18 @@ class DiseasePie(Dashboard.Item):
         }
 
     def __call__(self, csv_path, year, disease):
-        # Load and preprocess data
-        diseasedata = pd.read_csv(csv_path)
-        diseasedata.rename(columns={"State/UT": "States/UTs"}, inplace=True)
-        df_melted = diseasedata.melt(
-            id_vars=["States/UTs"],
-            var_name="Year-Disease",
-            value_name="Cases"
-        )
-        df_melted[["Year", "Disease"]] = df_melted["Year-Disease"].str.split("-", expand=True)
-        df_filtered = df_melted[(df_melted["Year"] == year) & (df_melted["Disease"] == disease)]
-
         # Prepare data for the pie chart
-        pie_data = [
-            {"id": row["States/UTs"], "label": row["States/UTs"], "value": row["Cases"]}
-            for _, row in df_filtered.iterrows()
-        ]
+        with stage("pie.data"):
+            data = pie_data(load_dataset(csv_path).cube, year, disease)
 
-        with mui.Paper(key=self._key, sx={"display": "flex", "flexDirection": "column", "borderRadius": 3, }, elevation=1):
+        with stage("pie.render"), mui.Paper(key=self._key, sx={"display": "flex", "flexDirection": "column", "borderRadius": 3, }, elevation=1):
             with self.title_bar():
                 mui.icon.PieChart()
                 mui.Typography(f"{disease} Cases in {year}", sx={"flex": 1})
 
             with mui.Box(sx={"flex": 1, "minHeight": 0}):
                 nivo.Pie(
-                    data=pie_data,
+                    data=data,
                     theme=self._theme["dark" if self._dark_mode else "light"],
                     margin={"top": 80, "right": 0, "bottom": 80, "left": 40},
                     innerRadius=0.5,
@@ -0,0 +1,176 @@
+import inspect
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock
+
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from .datastore import load_dataset
+from .diskcache import warm_figure
+
+
+# Background threads building figures ahead of use, overridable through the
+# environment. Setting NDMC_PREFETCH_WORKERS to 0 disables prefetching.
+PREFETCH_WORKERS = int(os.environ.get("NDMC_PREFETCH_WORKERS", 2))
+
+# Most bytes of figures one render may add to the in-memory figure cache
+PREFETCH_MAX_BYTES = int(os.environ.get("NDMC_PREFETCH_MAX_BYTES", 16 * 1024 * 1024))
+
+# Years on either side of the rendered one that are prefetched
+PREFETCH_YEARS = 1
+
+logger = logging.getLogger(__name__)
+
+
+class PrefetchBatch:
+    """Figures queued after one render; cancelled when the same session renders again."""
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.cancelled = Event()
+        # Bytes added so far, updated under the Prefetcher's lock
+        self.bytes = 0
+        self.futures = []
+
+    def cancel(self):
+        self.cancelled.set()
+        return sum(future.cancel() for future in self.futures)
+
+
+class Prefetcher:
+    """
+    Builds figures into the in-memory figure cache on a thread pool.
+    :param max_workers: Number of background threads.
+    :param max_bytes: Most bytes of figures one batch may add, see warm_figure.
+        Jobs check it before they start, so figures already being built
+        when it is reached still go in.
+
+    Each owner (a Streamlit session) has at most one batch. Submitting a
+    new one cancels the jobs of the previous batch that have not started;
+    a running job finishes its figure but the batch stops there.
+    """
+
+    def __init__(self, max_workers=PREFETCH_WORKERS, max_bytes=PREFETCH_MAX_BYTES):
+        self.max_bytes = max_bytes
+        # Threads start with the first job, so a disabled prefetcher costs nothing
+        self._pool = ThreadPoolExecutor(max(max_workers, 1), thread_name_prefix="prefetch")
+        self._batches = {}
+        self._lock = Lock()
+        self.submitted = 0
+        self.warmed = 0
+        self.skipped = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    def submit(self, owner, jobs):
+        """
+        Replaces the batch of ``owner`` by ``jobs``, run in order.
+        :param jobs: Functions returning (figure cache key, build function).
+        """
+        batch = PrefetchBatch(owner)
+        with self._lock:
+            previous = self._batches.get(owner)
+            self._batches[owner] = batch
+            self.submitted += len(jobs)
+        # Outside the lock: cancelling runs the done callbacks, see _release
+        if previous is not None:
+            cancelled = previous.cancel()
+            with self._lock:
+                self.cancelled += cancelled
+        batch.futures = [self._pool.submit(self._run, batch, job) for job in jobs]
+        if batch.futures:
+            batch.futures[-1].add_done_callback(lambda _: self._release(batch))
+        return batch
+
+    def _release(self, batch):
+        with self._lock:
+            if self._batches.get(batch.owner) is batch:
+                del self._batches[batch.owner]
+
+    def _run(self, batch, job):
+        with self._lock:
+            if batch.cancelled.is_set() or batch.bytes >= self.max_bytes:
+                self.skipped += 1
+                return
+        try:
+            key, build = job()
+            added = warm_figure(key, build)
+        except Exception:
+            # The render builds the figure itself if it is needed after all
+            logger.exception("Prefetching a figure failed")
+            with self._lock:
+                self.failed += 1
+            return
+        with self._lock:
+            batch.bytes += added
+            if added:
+                self.warmed += 1
+            else:
+                self.skipped += 1
+
+    def stats(self):
+        """Jobs submitted, warmed into the cache, skipped, cancelled and failed since start."""
+        with self._lock:
+            return {
+                "submitted": self.submitted,
+                "warmed": self.warmed,
+                "skipped": self.skipped,
+                "cancelled": self.cancelled,
+                "failed": self.failed,
+                "pending": sum(
+                    not future.done() for batch in self._batches.values() for future in batch.futures
+                ),
+            }
+
+
+_prefetcher = None
+_prefetcher_lock = Lock()
+
+
+def prefetcher():
+    """The process-wide Prefetcher, started on first use."""
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = Prefetcher()
+        return _prefetcher
+
+
+def neighbours(years, diseases, year, disease, steps=PREFETCH_YEARS):
+    """
+    (year, disease) views likely to follow (year, disease), most likely first:
+    the next and previous years, then the other diseases of the same year.
+    """
+    year = str(year)
+    views = []
+    if year in years:
+        i = years.index(year)
+        for step in range(1, steps + 1):
+            views += [(years[j], disease) for j in (i + step, i - step) if 0 <= j < len(years)]
+    views += [(year, d) for d in diseases if d != disease]
+    return views
+
+
+def prefetch_neighbours(figure_job, *args, **kwargs):
+    """
+    Queues the figures of the views around the one just rendered (see
+    neighbours) for the current Streamlit session. Does nothing outside
+    Streamlit, for the interactive timeline or with prefetching disabled.
+    :param figure_job: Returns (figure cache key, build function) when called
+        with ``args`` and ``kwargs``, which name csv_path, year and disease.
+    """
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None or PREFETCH_WORKERS <= 0:
+        return None
+    options = inspect.signature(figure_job).bind(*args, **kwargs).arguments
+    if options.get("interactive"):
+        # Every year and disease is in the figure already
+        return None
+
+    dataset = load_dataset(options["csv_path"])
+    jobs = [
+        lambda y=y, d=d: figure_job(**dict(options, year=y, disease=d))
+        for y, d in neighbours(dataset.years, dataset.diseases, options["year"], options["disease"])
+    ]
+    return prefetcher().submit(ctx.session_id, jobs)
@@ -3,6 +3,22 @@ import streamlit as st
 import pandas as pd
 from streamlit_elements import mui, nivo
 from .dashboard import Dashboard
+from .datastore import load_dataset
+from .timing import stage
+
+
+def radar_data(cube, year):
+    """
+    Nivo radar rows, one per state with its cases of every disease in one year.
+    :return: (rows, keys) where keys are the disease names.
+    """
+    # Disease x State matrix for the given year
+    matrix = cube.year_matrix(year).tolist()
+    rows = [
+        {"States/UTs": state, **dict(zip(cube.diseases, values))}
+        for state, values in zip(cube.states, zip(*matrix))
+    ]
+    return rows, cube.diseases
 
 
 class Radar(Dashboard.Item):
@@ -42,36 +58,12 @@ class Radar(Dashboard.Item):
 
     def __call__(self, csv_path,year):
         try:
-            diseasedata = pd.read_csv(csv_path)
-            diseasedata.rename(columns={"State/UT": "States/UTs"}, inplace=True)
-
-            # Melt the dataframe to long format
-            df_melted = diseasedata.melt(
-                id_vars=["States/UTs"],
-                var_name="Year-Disease",
-                value_name="Cases"
-            )
-
-            # Split "Year-Disease" into separate columns
-            df_melted[["Year", "Disease"]] = df_melted["Year-Disease"].str.split("-", expand=True)
-
-            # Filter data for the given year
-            df_filtered = df_melted[df_melted["Year"] == str(year)]
-
-            radar_data = df_filtered.pivot_table(
-                index="States/UTs",
-                columns="Disease",
-                values="Cases",
-                aggfunc="sum",
-                fill_value=0
-            ).reset_index()
-
-            data = radar_data.to_dict(orient="records")
-            keys = radar_data.columns[1:]
+            with stage("radar.data"):
+                data, keys = radar_data(load_dataset(csv_path).cube, year)
         except Exception as e:
             st.error(f"Error processing data: {e}")
             return
-        with mui.Paper(key=self._key, sx={"display": "flex", "flexDirection": "column", "borderRadius": 3, "overflow": "hidden"}, elevation=1):
+        with stage("radar.render"), mui.Paper(key=self._key, sx={"display": "flex", "flexDirection": "column", "borderRadius": 3, "overflow": "hidden"}, elevation=1):
             with self.title_bar():
                 mui.icon.Radar()
                 mui.Typography(f"Disease Cases in {year}", sx={"flex": 1})
@@ -80,7 +72,7 @@ class Radar(Dashboard.Item):
                 nivo.Radar(
                     data=data,
                     theme=self._theme["dark" if self._dark_mode else "light"],
-                    keys=keys.tolist(),
+                    keys=keys,
                     indexBy="States/UTs",
                     valueFormat=">-.2f",
                     margin={"top": 70, "right": 80, "bottom": 40, "left": 80},
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+
+def parse_header(column):
+    """Splits a "Year-Disease" column header into (year, disease), or None for id columns."""
+    year, sep, disease = column.partition("-")
+    if not sep or not year.strip().isdigit():
+        return None
+    return year.strip(), disease.strip()
+
+
+def parse_headers(columns):
+    """
+    Parses every "Year-Disease" header once.
+    :return: (value_columns, years, diseases, year_codes, disease_codes) where the
+        codes give, per value column, its position in ``years`` and ``diseases``.
+        Years are sorted; diseases keep their first-seen order.
+    """
+    parsed = [(column, parse_header(column)) for column in columns]
+    parsed = [(column, header) for column, header in parsed if header is not None]
+    value_columns = [column for column, _ in parsed]
+    years = sorted({year for _, (year, _) in parsed})
+    diseases = list(dict.fromkeys(disease for _, (_, disease) in parsed))
+    year_index = {year: i for i, year in enumerate(years)}
+    disease_index = {disease: i for i, disease in enumerate(diseases)}
+    year_codes = np.array([year_index[year] for _, (year, _) in parsed], dtype=np.intp)
+    disease_codes = np.array([disease_index[disease] for _, (_, disease) in parsed], dtype=np.intp)
+    return value_columns, years, diseases, year_codes, disease_codes
+
+
+def cube_to_long(ids, years, diseases, values, observed):
+    """
+    Reshapes Year x Disease x State case counts into the tidy long frame,
+    one row per (year, disease, state) in that order.
+    Replaces melting the wide CSV and splitting "Year-Disease" once per
+    cell: the headers were parsed once per column into the cube's axes,
+    and Year, Disease and the id columns come out categorical.
+    :param ids: One row per state with the id columns, in the order of the state axis.
+    :param values: Case counts of shape (years, diseases, states).
+    :param observed: bool array of the same shape; Cases is NaN where it is False.
+    """
+    n_years, n_diseases, n_states = values.shape
+    state_codes = np.tile(np.arange(n_states), n_years * n_diseases)
+    long = {}
+    for column in ids.columns:
+        codes, uniques = pd.factorize(ids[column])
+        long[column] = pd.Categorical.from_codes(codes[state_codes], uniques)
+    cases = values.reshape(-1)
+    observed = observed.reshape(-1)
+    long["Cases"] = cases if observed.all() else np.where(observed, cases, np.nan)
+    long["Year"] = pd.Categorical.from_codes(
+        np.repeat(np.arange(n_years), n_diseases * n_states), years, ordered=True
+    )
+    long["Disease"] = pd.Categorical.from_codes(
+        np.tile(np.repeat(np.arange(n_diseases), n_states), n_years), diseases
+    )
+    return pd.DataFrame(long)
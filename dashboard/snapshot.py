@@ -0,0 +1,136 @@
+import argparse
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from .cube import DiseaseCube
+
+
+# Snapshot layout: MAGIC, 8-byte little endian header length, JSON header,
+# then every array at an ALIGNMENT-byte boundary so it can be memory-mapped.
+SNAPSHOT_SUFFIX = ".snap"
+MAGIC = b"NDMCSNAP1\n"
+ALIGNMENT = 64
+
+
+def _pad(size):
+    return -size % ALIGNMENT
+
+
+def snapshot_bytes(dataset):
+    """
+    Encodes a dataset as a columnar snapshot.
+    Rows are ordered year, disease, state, so the ``cases`` column is also
+    the cube's Year x Disease x State array and loads without reshaping.
+    The year, disease and state of a row follow from its position and the
+    labels in the header, so they are not stored.
+    """
+    cube = dataset.cube
+    arrays = {
+        "cases": np.ascontiguousarray(cube.values, dtype=np.int32).ravel(),
+        "observed": np.ascontiguousarray(cube.observed).ravel(),
+    }
+
+    specs = {}
+    offset = 0
+    for name, array in arrays.items():
+        specs[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes + _pad(array.nbytes)
+    header = json.dumps({
+        "key": dataset.key,
+        "ids": {column: [None if pd.isna(value) else value for value in dataset.ids[column]]
+                for column in dataset.id_columns},
+        "years": cube.years,
+        "diseases": cube.diseases,
+        "arrays": specs,
+    }).encode("utf-8")
+
+    buf = io.BytesIO()
+    buf.write(MAGIC)
+    buf.write(len(header).to_bytes(8, "little"))
+    buf.write(header)
+    buf.write(b"\0" * _pad(buf.tell()))
+    for array in arrays.values():
+        buf.write(array.tobytes())
+        buf.write(b"\0" * _pad(array.nbytes))
+    return buf.getvalue()
+
+
+def write_snapshot(dataset, path):
+    """Writes a dataset snapshot to ``path`` atomically."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(snapshot_bytes(dataset))
+    os.replace(tmp_path, path)
+
+
+def is_snapshot(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def read_snapshot(path):
+    """
+    Memory-maps a snapshot written by write_snapshot.
+    The case counts stay in the OS page cache, so every worker process that
+    loads the same file shares one copy.
+    :return: (key, ids, cube) as taken by DiseaseDataset.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a disease data snapshot")
+        size = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(size))
+    base = len(MAGIC) + 8 + size
+    base += _pad(base)
+
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        shape = tuple(spec["shape"])
+        if np.prod(shape) == 0:
+            arrays[name] = np.zeros(shape, dtype=spec["dtype"])
+        else:
+            arrays[name] = np.memmap(path, dtype=spec["dtype"], mode="r", offset=base + spec["offset"], shape=shape)
+
+    ids = pd.DataFrame(header["ids"])
+    years, diseases = header["years"], header["diseases"]
+    states = ids["States/UTs"].tolist()
+    shape = (len(years), len(diseases), len(states))
+    cube = DiseaseCube(
+        years, diseases, states,
+        arrays["cases"].reshape(shape), arrays["observed"].reshape(shape),
+    )
+    return header["key"], ids, cube
+
+
+def main(argv=None):
+    from .datastore import load_dataset, update_dataset
+
+    parser = argparse.ArgumentParser(
+        description="Convert a wide disease CSV, or update a snapshot, into a memory-mappable snapshot."
+    )
+    parser.add_argument("csv_path", help="Wide disease CSV (States/UTs, Short Form, YYYY-Disease columns)")
+    parser.add_argument("snapshot_path", nargs="?", help="Output path, defaults to the CSV path with .snap")
+    parser.add_argument(
+        "--update", action="append", default=[], metavar="DELTA_CSV",
+        help="Wide CSV with new or corrected Year-Disease columns to apply, may be repeated",
+    )
+    args = parser.parse_args(argv)
+
+    snapshot_path = args.snapshot_path or os.path.splitext(args.csv_path)[0] + SNAPSHOT_SUFFIX
+    dataset = load_dataset(args.csv_path)
+    for delta_path in args.update:
+        dataset, changed = update_dataset(dataset, delta_path)
+        print(f"{delta_path}: {len(changed)} slices changed")
+    write_snapshot(dataset, snapshot_path)
+    print(f"Wrote {snapshot_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import html
+import math
+
+import numpy as np
+import shapely
+import streamlit as st
+from plotly.colors import convert_colors_to_same_type, unlabel_rgb
+
+from .datastore import load_dataset
+from .figures import LRUCache
+from .geostore import load_geometry
+from .gridmap import GRID_COLUMNS, PANEL_SIZE
+
+
+# Number of projected outlines kept in memory at once
+MAX_SVG_TEMPLATES = 16
+
+# Fill of states without data, and height of the title row in pixels
+NO_DATA_COLOR = "#e5e5e5"
+TITLE_HEIGHT = 24
+
+
+def _ring_path(coords, project):
+    x, y = project(coords)
+    points = [f"{a:.1f},{b:.1f}" for a, b in zip(x.tolist(), y.tolist())]
+    return "M" + points[0] + "L" + " ".join(points[1:-1]) + "Z"
+
+
+def color_values(values, color_scale, cmax=None):
+    """
+    Hex fill per value, interpolated along ``color_scale`` from 0 to ``cmax``.
+    NaN values get NO_DATA_COLOR. ``cmax`` defaults to the largest value.
+    """
+    values = np.asarray(values, dtype=float)
+    stops = np.array([unlabel_rgb(c) for c in convert_colors_to_same_type(list(color_scale), "rgb")[0]], dtype=float)
+    if cmax is None:
+        cmax = np.nanmax(values) if np.isfinite(values).any() else 1
+    position = np.clip(np.nan_to_num(values) / (cmax or 1), 0, 1) * (len(stops) - 1)
+    lower = np.minimum(position.astype(int), len(stops) - 2) if len(stops) > 1 else np.zeros(len(values), dtype=int)
+    upper = np.minimum(lower + 1, len(stops) - 1)
+    fraction = (position - lower)[:, None]
+    rgb = np.rint(stops[lower] * (1 - fraction) + stops[upper] * fraction).astype(int)
+    fills = ["#%02x%02x%02x" % tuple(color) for color in rgb.tolist()]
+    return [NO_DATA_COLOR if np.isnan(v) else fill for v, fill in zip(values, fills)]
+
+
+class SvgTemplate:
+    """
+    State outlines projected once into SVG path data.
+    :param geometry: StateGeometry providing the polygons.
+    :param width: Width of the map in pixels; the height follows the geometry's shape.
+
+    The polygons are simplified for ``width`` (see StateGeometry.level_for)
+    and projected equirectangularly, longitudes shortened by the cosine of
+    the middle latitude. render() then only assigns fill colors.
+    """
+
+    def __init__(self, geometry, width=PANEL_SIZE):
+        geometries = geometry.simplified(geometry.level_for(width))
+        minx, miny, maxx, maxy = shapely.total_bounds(geometries)
+        aspect = math.cos(math.radians((miny + maxy) / 2))
+        scale = width / (((maxx - minx) * aspect) or 1)
+
+        def project(coords):
+            return (coords[:, 0] - minx) * aspect * scale, (maxy - coords[:, 1]) * scale
+
+        self.width = width
+        self.height = math.ceil((maxy - miny) * scale)
+        self.names = geometry.names
+        self.paths = []
+        for feature in geometries:
+            rings = []
+            if feature is not None and not shapely.is_empty(feature):
+                for polygon in shapely.get_parts(feature):
+                    rings.append(_ring_path(np.asarray(polygon.exterior.coords), project))
+                    rings.extend(_ring_path(np.asarray(ring.coords), project) for ring in polygon.interiors)
+            self.paths.append("".join(rings))
+
+    def render(self, values, color_scale, cmax=None, title=None, hover=None):
+        """
+        Returns the SVG markup of the map with every feature filled by its value.
+        :param values: Value per feature in feature order, NaN for no data (see StateGeometry.scatter).
+        :param cmax: Value at the end of ``color_scale``, by default the largest value.
+        :param title: Text drawn above the map.
+        :param hover: Tooltip per feature, by default the feature names.
+        """
+        top = TITLE_HEIGHT if title else 0
+        height = self.height + top
+        parts = [
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{self.width}" height="{height}" '
+            f'viewBox="0 0 {self.width} {height}" font-family="Arial, sans-serif">'
+        ]
+        if title:
+            parts.append(
+                f'<text x="{self.width / 2:.0f}" y="{TITLE_HEIGHT - 7}" text-anchor="middle" '
+                f'font-size="14" font-weight="bold">{html.escape(title)}</text>'
+            )
+        parts.append(f'<g transform="translate(0,{top})" stroke="#ffffff" stroke-width="0.5" fill-rule="evenodd">')
+        hover = self.names if hover is None else hover
+        for path, fill, tip in zip(self.paths, color_values(values, color_scale, cmax), hover):
+            if path:
+                parts.append(f'<path d="{path}" fill="{fill}"><title>{html.escape(str(tip))}</title></path>')
+        parts.append("</g></svg>")
+        return "".join(parts)
+
+
+_templates = LRUCache(MAX_SVG_TEMPLATES)
+
+
+def svg_template(geometry, width=PANEL_SIZE):
+    """Returns the cached SvgTemplate of a geometry at a width."""
+    return _templates.get_or_build((geometry.key, width), lambda: SvgTemplate(geometry, width))
+
+
+def svg_map(dataset, geometry, year, disease, color_scale, width=PANEL_SIZE, cmax=None, title=None,
+            percent=False):
+    """
+    Static SVG map of one year and disease.
+    :param cmax: Value at the end of the color scale, e.g. shared by several panels.
+    :param title: Title above the map, by default the disease, year and total cases.
+    :param percent: Show each state's share of the total in the tooltips instead of its cases.
+    """
+    template = svg_template(geometry, width)
+    cube = dataset.cube
+    if (str(year), disease) in cube:
+        y, d = cube.year_index[str(year)], cube.disease_index[disease]
+        cases = np.where(cube.observed[y, d], cube.values[y, d], np.nan)
+    else:
+        cases = np.full(len(cube.states), np.nan)
+    values = geometry.scatter(cube.states, cases)
+    if percent and (str(year), disease) in cube:
+        shares = geometry.scatter(cube.states, dataset.aggregates.share(year, disease))
+        hover = [
+            name if np.isnan(share) else f"{name}: {share:.2f}%"
+            for name, share in zip(geometry.names, shares)
+        ]
+    else:
+        hover = [
+            name if np.isnan(value) else f"{name}: {value:,.0f}"
+            for name, value in zip(geometry.names, values)
+        ]
+    if title is None:
+        title = f"{disease} Cases in {year} - Total Cases: {dataset.aggregates.total(year, disease):,}"
+    return template.render(values, color_scale, cmax=cmax, title=title, hover=hover)
+
+
+class SvgGridMap:
+    def __init__(self):
+        pass
+
+    def __call__(self, csv_path, geojson_path, start_year, end_year, disease, color_scale):
+        # Load data
+        dataset = load_dataset(csv_path)
+        geometry = load_geometry(geojson_path)
+
+        years = [
+            year for year in dataset.cube.years
+            if int(start_year) <= int(year) <= int(end_year)
+        ]
+        if not years:
+            st.error("No maps could be created. Please check your data or inputs.")
+            return
+
+        # One color range for every panel, like the shared color axis of GridMap
+        d = dataset.cube.disease_index.get(disease)
+        y = [dataset.cube.year_index[year] for year in years]
+        cmax = int(dataset.aggregates.peaks[y, d].max()) if d is not None else None
+
+        columns = st.columns(min(GRID_COLUMNS, len(years)))
+        for i, year in enumerate(years):
+            title = f"{year} - Total Cases: {dataset.aggregates.total(year, disease):,}"
+            svg = svg_map(dataset, geometry, year, disease, color_scale, cmax=cmax, title=title)
+            columns[i % len(columns)].markdown(svg, unsafe_allow_html=True)
+        st.caption(f"{disease} Cases, color scale from 0 to {cmax or 0:,}")
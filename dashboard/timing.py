@@ -0,0 +1,118 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from threading import Lock
+
+import pandas as pd
+import streamlit as st
+
+
+# Structured log with one JSON line per rerun. Off unless NDMC_TIMING_LOG
+# names a file; it grows with every rerun, so rotate it when left on.
+TIMING_LOG = os.environ.get("NDMC_TIMING_LOG", "")
+
+
+class RerunTimings:
+    """
+    Stage timings collected during one Streamlit rerun.
+    :param page: Name of the page being rendered.
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self.started = time.perf_counter()
+        self.timestamp = datetime.now(timezone.utc).isoformat()
+        self.stages = []
+        self.depth = 0
+        self.total = None
+
+    def add(self, name, start, seconds, depth, **details):
+        self.stages.append(dict(
+            name=name,
+            start_ms=round((start - self.started) * 1000, 3),
+            ms=round(seconds * 1000, 3),
+            depth=depth,
+            **details,
+        ))
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+        # Stages are appended as they end; list them in the order they started
+        self.stages.sort(key=lambda entry: entry["start_ms"])
+
+    def record(self):
+        return {
+            "time": self.timestamp,
+            "page": self.page,
+            "pid": os.getpid(),
+            "total_ms": round((self.total or 0) * 1000, 3),
+            "stages": self.stages,
+        }
+
+
+_current = ContextVar("rerun_timings", default=None)
+_log_lock = Lock()
+
+
+@contextmanager
+def stage(name, **details):
+    """
+    Times the enclosed block as one stage of the current rerun, e.g. "map.join".
+    Outside of rerun() (or in worker threads) it only runs the block.
+    :param details: Extra fields stored with the stage, e.g. cache="hit".
+    """
+    timings = _current.get()
+    if timings is None:
+        yield details
+        return
+    start = time.perf_counter()
+    depth = timings.depth
+    timings.depth += 1
+    try:
+        yield details
+    finally:
+        timings.depth = depth
+        timings.add(name, start, time.perf_counter() - start, depth, **details)
+
+
+@contextmanager
+def rerun(page):
+    """
+    Collects the stages of one rerun of ``page`` and appends them to TIMING_LOG if set.
+    Inside another rerun, e.g. a fragment during a full run, the stages go
+    to the outer one.
+    """
+    if _current.get() is not None:
+        yield _current.get()
+        return
+    timings = RerunTimings(page)
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+        timings.finish()
+        write_log(timings.record())
+
+
+def write_log(record, path=TIMING_LOG):
+    if not path:
+        return
+    line = json.dumps(record) + "\n"
+    with _log_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+def show_panel(timings):
+    """Sidebar table of the stages of a finished rerun."""
+    with st.sidebar.expander("Performance", expanded=True):
+        st.caption(f"{timings.page}: {timings.total * 1000:.1f} ms in total")
+        rows = [
+            {"Stage": " " * entry["depth"] + entry["name"], "ms": entry["ms"]}
+            for entry in timings.stages
+        ]
+        st.dataframe(pd.DataFrame(rows, columns=["Stage", "ms"]), hide_index=True, use_container_width=True)
@@ -0,0 +1,149 @@
+import math
+
+import numpy as np
+import shapely
+
+
+# Grid cells per side of the bounding box that coordinates are snapped to
+QUANTIZATION = 100_000
+
+
+def _polygons(geometry):
+    """Rings of every polygon of a (multi)polygon as coordinate arrays, exterior first."""
+    if geometry is None or shapely.is_empty(geometry):
+        return []
+    return [
+        [np.asarray(polygon.exterior.coords)] + [np.asarray(ring.coords) for ring in polygon.interiors]
+        for polygon in shapely.get_parts(geometry)
+    ]
+
+
+def encode(geometries, quantization=QUANTIZATION):
+    """
+    Encodes polygons as a TopoJSON topology with quantized, delta-encoded arcs.
+    Coordinates are snapped to a ``quantization`` x ``quantization`` grid over
+    the bounding box, and a border shared by two polygons is stored once as
+    an arc that both reference (``~i`` for arc ``i`` reversed). Rings that
+    collapse on the grid are dropped.
+    :param geometries: Polygons or MultiPolygons in feature order.
+    :return: Topology dict whose "features" object has one geometry per input.
+    """
+    geometries = np.asarray(geometries)
+    minx, miny, maxx, maxy = shapely.total_bounds(geometries)
+    kx = (maxx - minx) / (quantization - 1) or 1.0
+    ky = (maxy - miny) / (quantization - 1) or 1.0
+
+    # Snap every ring to the grid as an open list of points, without repeats
+    shapes = []
+    for geometry in geometries:
+        polygons = []
+        for rings in _polygons(geometry):
+            snapped = []
+            for coords in rings:
+                q = np.rint((coords[:, :2] - (minx, miny)) / (kx, ky)).astype(np.int64)
+                q = q[np.r_[True, (np.diff(q, axis=0) != 0).any(axis=1)]]
+                if len(q) < 4:
+                    if not snapped:
+                        break
+                    continue
+                snapped.append([tuple(point) for point in q[:-1].tolist()])
+            if snapped:
+                polygons.append(snapped)
+        shapes.append(polygons)
+
+    # A point is a junction where the rings passing through it have different
+    # neighbours: where three states meet, or a shared border meets the coast
+    neighbours = {}
+    junctions = set()
+    for polygons in shapes:
+        for rings in polygons:
+            for ring in rings:
+                n = len(ring)
+                for i, point in enumerate(ring):
+                    pair = (ring[i - 1], ring[(i + 1) % n])
+                    if pair[1] < pair[0]:
+                        pair = pair[::-1]
+                    if neighbours.setdefault(point, pair) != pair:
+                        junctions.add(point)
+
+    arcs = []
+    arc_index = {}
+
+    def add_arc(points):
+        key = tuple(points)
+        if key in arc_index:
+            return arc_index[key]
+        if key[::-1] in arc_index:
+            return ~arc_index[key[::-1]]
+        arc_index[key] = len(arcs)
+        arcs.append(points)
+        return arc_index[key]
+
+    def cut(ring):
+        cuts = [i for i, point in enumerate(ring) if point in junctions]
+        if not cuts:
+            # Start closed rings at their smallest point so a ring shared
+            # without junctions (an enclave) is found in either direction
+            start = ring.index(min(ring))
+            ring = ring[start:] + ring[:start]
+            return [add_arc(ring + ring[:1])]
+        ring = ring[cuts[0]:] + ring[:cuts[0]] + ring[cuts[0]:cuts[0] + 1]
+        cuts = [i - cuts[0] for i in cuts] + [len(ring) - 1]
+        return [add_arc(ring[a:b + 1]) for a, b in zip(cuts[:-1], cuts[1:])]
+
+    topo_geometries = []
+    for polygons in shapes:
+        if not polygons:
+            topo_geometries.append({"type": None})
+        elif len(polygons) == 1:
+            topo_geometries.append({"type": "Polygon", "arcs": [cut(ring) for ring in polygons[0]]})
+        else:
+            topo_geometries.append({
+                "type": "MultiPolygon",
+                "arcs": [[cut(ring) for ring in rings] for rings in polygons],
+            })
+
+    encoded = []
+    for points in arcs:
+        points = np.asarray(points, dtype=np.int64)
+        encoded.append(np.vstack([points[:1], np.diff(points, axis=0)]).tolist())
+    return {
+        "type": "Topology",
+        "transform": {"scale": [kx, ky], "translate": [float(minx), float(miny)]},
+        "objects": {"features": {"type": "GeometryCollection", "geometries": topo_geometries}},
+        "arcs": encoded,
+    }
+
+
+def decode(topology):
+    """
+    GeoJSON geometry dicts (None for empty ones) of a topology from encode(), in feature order.
+    Coordinates are rounded to the decimals the quantization grid can
+    resolve, so they serialize in a few characters each.
+    """
+    (kx, ky), (x0, y0) = topology["transform"]["scale"], topology["transform"]["translate"]
+    decimals = max(0, math.ceil(-math.log10(min(kx, ky))))
+    arcs = [
+        np.round(np.cumsum(np.asarray(arc, dtype=np.int64), axis=0) * (kx, ky) + (x0, y0), decimals).tolist()
+        for arc in topology["arcs"]
+    ]
+
+    def ring(indexes):
+        coords = []
+        for i in indexes:
+            points = arcs[i] if i >= 0 else arcs[~i][::-1]
+            coords.extend(points[1:] if coords else points)
+        return coords
+
+    geometries = []
+    for shape in topology["objects"]["features"]["geometries"]:
+        if shape["type"] == "Polygon":
+            geometries.append({"type": "Polygon", "coordinates": [ring(r) for r in shape["arcs"]]})
+        elif shape["type"] == "MultiPolygon":
+            geometries.append({
+                "type": "MultiPolygon",
+                "coordinates": [[ring(r) for r in rings] for rings in shape["arcs"]],
+            })
+        else:
+            geometries.append(None)
+    return geometries
@@ -7,6 +7,7 @@ from streamlit_elements import elements, sync, event
 from types import SimpleNamespace
 
 from dashboard import Dashboard, Card, DataGrid, Radar, Player, DiseasePie, DiseaseMap  # Import DiseaseMap
+from dashboard import SessionHandle, load_dataset, rerun, show_panel, stage
 
 # selected_year = st.session_state.get("selected_year", "2008")  # Default: 2008
 # selected_disease = st.session_state.get("selected_disease", "Lymphoedema")  # Default: Lymphoedema
@@ -47,17 +48,12 @@ def main():
         unsafe_allow_html=True
     )
 
-    diseasedata = pd.read_csv('DiseaseData.csv')
-    df_melted = diseasedata.melt( #this step for easier visualization
-        id_vars=["States/UTs"],
-        var_name="Year-Disease",
-        value_name="Cases"
-    )
-    # # Split Year and Disease into separate columns
-    df_melted[["Year", "Disease"]] = df_melted["Year-Disease"].str.split("-", expand=True)
-    df_melted.drop(columns=["Year-Disease"], inplace=True)
-
-    df_melted["States/UTs"] = df_melted["States/UTs"].str.strip()
+    # Parsed and melted once per file and shared by all sessions; the handle
+    # keeps it loaded while this session is open
+    if "data_handle" not in state:
+        state.data_handle = SessionHandle()
+    with stage("main.load_dataset"):
+        df_melted = load_dataset('DiseaseData.csv', holder=state.data_handle).long
 
     # merged = gdf.merge(df_melted, left_on="NAME_1", right_on="States/UTs", how="left")
     # merged = gdf.merge(df2_melted, left_on="NAME_1", right_on="States/UTs", how="left")
@@ -146,15 +142,7 @@ def main():
                 year=year,                              # Sidebar-selected year
                 disease=disease                         # Sidebar-selected disease
             )
-             # Radar Component
-            radar_data = df_melted[df_melted["Year"] == year]  # Filter for selected year
-            radar_data = radar_data.pivot_table(
-                index="States/UTs",
-                columns="Disease",
-                values="Cases",
-                aggfunc="sum",
-                fill_value=0
-            ).reset_index()
+             # Radar Component, reads the year's Disease x State matrix from the data store
             w.radar(
                 csv_path="DiseaseData.csv",
                 year=year
@@ -165,4 +153,8 @@ def main():
 
 if __name__ == "__main__":
     st.set_page_config(layout="wide")
-    main()
+    # Stage timings of this rerun go to the timing log and, on request, the sidebar
+    with rerun("streamlit_app") as timings:
+        main()
+    if st.sidebar.checkbox("Show performance panel"):
+        show_panel(timings)
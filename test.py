@@ -1,3 +1,4 @@
+import functools
 import json
 import streamlit as st
 import pandas as pd
@@ -10,16 +11,56 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 from io import BytesIO
 
-from dashboard import DiseaseMap,DiseasePercentMap,GridMap  # Import DiseaseMap
+from dashboard import DiseaseMap,DiseasePercentMap,GridMap,SvgGridMap  # Import DiseaseMap
+from dashboard import SessionHandle, data_source, dataset_stats, figure_cache, geometry_stats, load_dataset, load_geometry
+from dashboard import prefetcher
+from dashboard import rerun, show_panel, stage
 
 # selected_year = st.session_state.get("selected_year", "2008")  # Default: 2008
 # selected_disease = st.session_state.get("selected_disease", "Lymphoedema")  # Default: Lymphoedema
 
 
+# Inputs of the page views, set by the sidebar fragments through publish()
+VIEW_INPUTS = {
+    "Main Page": {"year", "disease", "color_scale", "interactive"},
+    "Percentage": {"year", "disease", "color_scale"},
+    "Compare Years": {"start_year", "end_year", "disease", "color_scale"},
+}
+
+
+def fragment(func):
+    """
+    st.fragment that times its partial reruns like full ones.
+    Widgets inside rerun only the fragment; see publish() for values other fragments read.
+    """
+    @st.fragment
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with rerun(f"test.{func.__name__}"):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def publish(key, value):
+    """
+    Stores a value read by the page views in the session state.
+    Streamlit reruns only the fragment whose widget changed, so when the
+    value changes during such a partial rerun and the current page reads
+    it (VIEW_INPUTS), the whole app is rerun to redraw the page. Changes
+    the page does not read stay inside the fragment.
+    """
+    if key in state and state[key] == value:
+        return
+    state[key] = value
+    if not state.get("full_run") and key in VIEW_INPUTS.get(state.current_page, ()):
+        st.rerun()
+
+
+@st.cache_data(show_spinner=False)
 def show_color_scale(colors):
     """
     Generates a horizontal bar showing the color scale.
-    Converts hex colors to RGB for plotting.
+    Converts hex colors to RGB for plotting. Rendered once per color scale.
     """
     from matplotlib.colors import to_rgb
 
@@ -37,7 +78,7 @@ def show_color_scale(colors):
     plt.savefig(buf, format="png", bbox_inches="tight", pad_inches=0)
     buf.seek(0)
     plt.close(fig)
-    return buf
+    return buf.getvalue()
 
 
 def preset_color_picker():
@@ -53,52 +94,112 @@ def preset_color_picker():
         "Viridis": sns.color_palette("viridis", 10).as_hex(),
     }
 
-    selected_scale = st.sidebar.selectbox(
+    selected_scale = st.selectbox(
         "Select a Preset Color Scale",
         options=list(preset_scales.keys()),
     )
 
     # Display the selected color scale preview
-    st.sidebar.image(show_color_scale(preset_scales[selected_scale]), use_container_width=True)
+    st.image(show_color_scale(tuple(preset_scales[selected_scale])), use_container_width=True)
     return preset_scales[selected_scale]
 
-def main_page(color_scale, year, disease):
+
+@fragment
+def data_controls(dataset):
+    """
+    Sidebar year, disease and year range selection, rerun on its own.
+    :param dataset: Dataset of the uploaded CSV.
+    """
+    df_melted = dataset.long
+
+    st.markdown("### Year Selection")
+    year = st.slider(
+        "Select a year:",
+        min_value=int(df_melted["Year"].min()),
+        max_value=int(df_melted["Year"].max()),
+        value=int(df_melted["Year"].min())
+    )
+    disease = st.selectbox("Select Disease", df_melted["Disease"].unique())
+
+    st.markdown("### Range Selection")
+    start_year = st.number_input(
+        "Start Year",
+        min_value=int(df_melted["Year"].min()),
+        value=int(df_melted["Year"].min())
+    )
+    end_year = st.number_input(
+        "End Year",
+        min_value=start_year,
+        value=start_year + 1
+    )
+    if start_year > end_year:
+        st.error("Start Year cannot be greater than End Year.")
+
+    publish("year", str(year))
+    publish("disease", disease)
+    publish("start_year", start_year)
+    publish("end_year", end_year)
+
+
+@fragment
+def display_controls():
+    """Sidebar color scale picker and timeline switch, rerun on their own."""
+    # Color scale picker
+    # color_start = st.sidebar.color_picker("Pick starting color", "#ff0000")
+    # color_end = st.sidebar.color_picker("Pick ending color", "#0000ff")
+    # color_scale = [color_start, color_end]
+    publish("color_scale", preset_color_picker())
+    publish("interactive", st.checkbox("Interactive timeline", help="Switch year and disease in the browser without reruns"))
+
+@fragment
+def main_page(csv_source, geojson_source, color_scale, year, disease, interactive=False):
     """
     Main page with a single map for the selected year and disease.
     :param w: Dashboard object for Streamlit Elements.
+    :param csv_source: Uploaded disease data, see data_source.
+    :param geojson_source: Uploaded state polygons, see data_source.
     :param color_scale: Selected color scale for the map.
     :param year: Year to visualize.
     :param disease: Disease to visualize.
+    :param interactive: Ship every year and disease in one figure and switch in the browser.
     """
     with elements("main_page"):
        
             map_component = DiseaseMap()
             map_component(
-                csv_path="DiseaseData.csv",
-                geojson_path="india_telengana.geojson",
+                csv_path=csv_source,
+                geojson_path=geojson_source,
                 year=year,
                 disease=disease,
-                color_scale=color_scale
+                color_scale=color_scale,
+                interactive=interactive
             )   
 
-def compare_years_page(start_year, end_year, disease, color_scale):
+@fragment
+def compare_years_page(csv_source, geojson_source, start_year, end_year, disease, color_scale):
     """
-    Compare years page displaying 4 maps side by side.
+    Compare years page displaying one map per year of the selected range.
+    Switching to static thumbnails only reruns this page.
     """
     st.markdown("### Compare Disease Data Across Selected Years")
-    comparison = GridMap()
+    static = st.checkbox("Static thumbnails", help="Draw the panels as plain SVG images instead of interactive maps")
+    comparison = SvgGridMap() if static else GridMap()
     comparison(
-        csv_path="DiseaseData.csv",
-        geojson_path="india_telengana.geojson",
+        csv_path=csv_source,
+        geojson_path=geojson_source,
         start_year=start_year,
         end_year=end_year,
         disease=disease,
         color_scale=color_scale,
     )
-def percent_page(color_scale, year, disease):
+
+@fragment
+def percent_page(csv_source, geojson_source, color_scale, year, disease):
     """
     Main page with a single map for the selected year and disease.
     :param w: Dashboard object for Streamlit Elements.
+    :param csv_source: Uploaded disease data, see data_source.
+    :param geojson_source: Uploaded state polygons, see data_source.
     :param color_scale: Selected color scale for the map.
     :param year: Year to visualize.
     :param disease: Disease to visualize.
@@ -107,13 +208,35 @@ def percent_page(color_scale, year, disease):
        
             map_component = DiseasePercentMap()
             map_component(
-                csv_path="DiseaseData.csv",
-                geojson_path="india_telengana.geojson",
+                csv_path=csv_source,
+                geojson_path=geojson_source,
                 year=year,
                 disease=disease,
                 color_scale=color_scale
             )  
 
+def show_memory_panel():
+    """Sidebar table of the datasets and geometries shared by every session of this process."""
+    rows = [dict(kind="dataset", **row) for row in dataset_stats()]
+    rows += [dict(kind="geometry", **row) for row in geometry_stats()]
+    with st.sidebar.expander("Shared data", expanded=True):
+        st.caption(f"{sum(row['bytes'] for row in rows) / 2**20:.1f} MB resident")
+        frame = pd.DataFrame(rows, columns=["kind", "key", "sessions", "bytes"])
+        frame["key"] = frame["key"].str[:12]
+        st.dataframe(frame, hide_index=True, use_container_width=True)
+
+        figures = figure_cache().stats()
+        st.caption(
+            f"Figure cache: {figures['entries']} figures, {figures['bytes'] / 2**20:.1f} of "
+            f"{figures['max_bytes'] / 2**20:.0f} MB, {figures['hits']} hits, {figures['misses']} misses "
+            f"({figures['hit_rate']:.0%}), {figures['evictions']} evictions"
+        )
+        prefetch = prefetcher().stats()
+        st.caption(
+            f"Prefetch: {prefetch['warmed']} of {prefetch['submitted']} figures warmed, {prefetch['skipped']} skipped, "
+            f"{prefetch['cancelled']} cancelled, {prefetch['failed']} failed, {prefetch['pending']} pending"
+        )
+
 def main():
     st.write(
         """
@@ -153,6 +276,11 @@ def main():
     if "current_page" not in state:
         state.current_page = "main"
 
+    # Datasets and geometries are shared by all sessions; this handle keeps
+    # the ones this session uses loaded until the session ends
+    if "data_handle" not in state:
+        state.data_handle = SessionHandle()
+
     # Sidebar filters
     st.sidebar.title("Disease Map Settings")
 
@@ -160,76 +288,61 @@ def main():
     csv_path = st.sidebar.file_uploader("Upload Disease Data CSV", type="csv")
     geojson_path = st.sidebar.file_uploader("Upload GeoJSON File", type="geojson")
 
+    # Hashed once per upload; every component below looks its data up by that hash
+    csv_path = data_source(csv_path)
+    geojson_path = data_source(geojson_path)
+    if geojson_path:
+        load_geometry(geojson_path, holder=state.data_handle)
+
     # Page selection
     page_options = ["Main Page", "Compare Years","Percentage"]
     state.current_page = st.sidebar.radio("Select Page", page_options)
 
     if csv_path:
-        diseasedata = pd.read_csv(csv_path)
-        df_melted = diseasedata.melt(
-            id_vars=["States/UTs", "Short Form"],
-            var_name="Year-Disease",
-            value_name="Cases"
-        )
-        df_melted[["Year", "Disease"]] = df_melted["Year-Disease"].str.split("-", expand=True)
-        df_melted.drop(columns=["Year-Disease"], inplace=True)
-        df_melted["States/UTs"] = df_melted["States/UTs"].str.strip()
-        df_melted["Short Form"] = df_melted["Short Form"].str.strip()
-
-        # Sidebar filters
-        st.sidebar.markdown("### Year Selection")
-        year = st.sidebar.slider(
-            "Select a year:",
-            min_value=int(df_melted["Year"].min()),
-            max_value=int(df_melted["Year"].max()),
-            value=int(df_melted["Year"].min())
-        )
-        disease = st.sidebar.selectbox("Select Disease", df_melted["Disease"].unique())
+        # Parsed once per uploaded file, reused on every rerun
+        with stage("main.load_dataset"):
+            dataset = load_dataset(csv_path, holder=state.data_handle)
 
-        st.sidebar.markdown("### Range Selection")
-        start_year = st.sidebar.number_input(
-            "Start Year",
-            min_value=int(df_melted["Year"].min()),
-            value=int(df_melted["Year"].min())
-        )
-        end_year = st.sidebar.number_input(
-            "End Year",
-            min_value=start_year,
-            value=start_year + 1
-        )
-        if start_year > end_year:
-            st.sidebar.error("Start Year cannot be greater than End Year.")
-        year_range = list(range(start_year, end_year + 1))
+        # Sidebar filters; each block reruns on its own and publishes what the pages read
+        with st.sidebar:
+            data_controls(dataset)
     else:
         st.info("Please upload the CSV file to proceed.")
         return
 
-    # Color scale picker
-    # color_start = st.sidebar.color_picker("Pick starting color", "#ff0000")
-    # color_end = st.sidebar.color_picker("Pick ending color", "#0000ff")
-    # color_scale = [color_start, color_end]
-    color_scale = preset_color_picker()
-
-    # Initialize dashboard
-    
+    with st.sidebar:
+        display_controls()
+    color_scale = state.color_scale
+    year, disease = state.year, state.disease
+    start_year, end_year = state.start_year, state.end_year
 
     # Main content based on selected page
     if state.current_page == "Main Page":
         if csv_path and geojson_path:
-            main_page(color_scale, str(year), disease)
+            main_page(csv_path, geojson_path, color_scale, year, disease, state.interactive)
         else:
             st.error("Please upload both the CSV and GeoJSON files to proceed.")
     elif state.current_page == "Percentage":
         if csv_path and geojson_path:
-            percent_page(color_scale, str(year), disease)
+            percent_page(csv_path, geojson_path, color_scale, year, disease)
         else:
             st.error("Please upload both the CSV and GeoJSON files to proceed.")
-    elif state.current_page == "Current Page":
+    elif state.current_page == "Compare Years":
         if csv_path and geojson_path:
-            compare_years_page(start_year, end_year, disease, color_scale)
+            compare_years_page(csv_path, geojson_path, start_year, end_year, disease, color_scale)
         else:
             st.error("Please upload both the CSV and GeoJSON files to proceed.")
 
 if __name__ == "__main__":
     st.set_page_config(layout="wide")
-    main()
\ No newline at end of file
+    # Stage timings of this rerun go to the timing log and, on request, the sidebar
+    with rerun("test") as timings:
+        # Lets publish() tell a full run from a fragment's partial rerun
+        state.full_run = True
+        try:
+            main()
+        finally:
+            state.full_run = False
+    if st.sidebar.checkbox("Show performance panel"):
+        show_panel(timings)
+        show_memory_panel()
\ No newline at end of file
@@ -0,0 +1,120 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+
+from dashboard.datastore import ingest
+from dashboard.snapshot import read_snapshot, snapshot_bytes
+from dashboard.datastore import DiseaseDataset
+from dashboard.topology import decode, encode
+
+
+CSV = """States/UTs,Short Form,2008-Lymphoedema,2008-Hydrocele,2010-Lymphoedema,2010-Hydrocele
+Goa,GO,10,1,12,
+Kerala,KL,30,3,20,4
+Punjab,PB,,2,5,6
+"""
+
+
+@pytest.fixture
+def dataset():
+    return ingest(io.BytesIO(CSV.encode("utf-8")))
+
+
+def delta(**columns):
+    return pd.DataFrame({"States/UTs": ["Goa", "Kerala", "Punjab"], **columns})
+
+
+def test_slice_reads_the_cube(dataset):
+    frame = dataset.slice(2010, "Hydrocele")
+    assert frame["States/UTs"].tolist() == ["Goa", "Kerala", "Punjab"]
+    assert frame["Cases"].tolist()[1:] == [4, 6]
+    assert np.isnan(frame["Cases"].iloc[0])
+    assert frame["Rank"].tolist()[1:] == [2, 1]
+    assert frame["Change"].tolist()[1:] == [1, 4]
+
+
+def test_slice_of_a_missing_year_is_empty_but_typed(dataset):
+    frame = dataset.slice(2009, "Hydrocele")
+    full = dataset.slice(2008, "Hydrocele")
+    assert frame.empty
+    assert list(frame.columns) == list(full.columns)
+    assert frame.dtypes.to_dict() == full.dtypes.to_dict()
+    # The label text of the maps
+    assert (frame["Short Form"] + "<br>" + frame["Cases"].astype(str)).empty
+
+
+def test_update_applies_the_delta(dataset):
+    updated, changed = dataset.update(delta(**{"2010-Hydrocele": [7, np.nan, np.nan], "2009-Hydrocele": [1, 2, 3]}), "u")
+    assert changed == {("2010", "Hydrocele"), ("2009", "Hydrocele"), ("2009", "Lymphoedema")}
+    assert updated.years == ["2008", "2009", "2010"]
+    assert updated.slice(2010, "Hydrocele")["Cases"].tolist() == [7, 4, 6]
+    assert updated.slice(2009, "Hydrocele")["Cases"].tolist() == [1, 2, 3]
+    # The base dataset is left as it was
+    assert np.isnan(dataset.slice(2010, "Hydrocele")["Cases"].iloc[0])
+
+
+def test_update_keeps_unchanged_slice_keys(dataset):
+    before = dataset.slice_key(2008, "Lymphoedema")
+    updated, changed = dataset.update(delta(**{"2010-Hydrocele": [7, 4, 6]}), "u")
+    assert changed == {("2010", "Hydrocele")}
+    assert updated.slice_key(2008, "Lymphoedema") == before
+    assert updated.slice_key(2010, "Hydrocele") != dataset.slice_key(2010, "Hydrocele")
+
+
+def test_update_adds_states(dataset):
+    added = pd.DataFrame({"States/UTs": ["Assam"], "Short Form": ["AS"], "2008-Hydrocele": [9]})
+    updated, changed = dataset.update(added, "u")
+    assert updated.cube.states == ["Goa", "Kerala", "Punjab", "Assam"]
+    assert len(changed) == 4
+    assert updated.slice(2008, "Hydrocele")["Cases"].tolist() == [1, 3, 2, 9]
+
+
+def test_update_matches_aggregates_built_from_scratch(dataset):
+    dataset.aggregates
+    updated, _ = dataset.update(delta(**{"2008-Hydrocele": [5, 1, 2], "2009-Lymphoedema": [1, 2, 3]}), "u")
+    rebuilt = DiseaseDataset(updated.key, updated.ids, updated.cube).aggregates
+    for table in ("totals", "peaks", "shares", "ranks", "changes"):
+        assert np.array_equal(getattr(updated.aggregates, table), getattr(rebuilt, table), equal_nan=True), table
+
+
+@pytest.mark.parametrize("value", [1.5, 3_000_000_000])
+def test_update_rejects_counts_the_cube_cannot_hold(dataset, value):
+    with pytest.raises(ValueError, match="2010-Hydrocele"):
+        dataset.update(delta(**{"2010-Hydrocele": [value, 1, 1]}), "u")
+
+
+@pytest.mark.parametrize("value", ["1.5", "3000000000"])
+def test_ingest_rejects_counts_the_cube_cannot_hold(value):
+    with pytest.raises(ValueError, match="2008-Lymphoedema"):
+        ingest(io.BytesIO(CSV.replace("Goa,GO,10", "Goa,GO," + value).encode("utf-8")))
+
+
+def test_snapshot_round_trip(dataset, tmp_path):
+    path = tmp_path / "data.snap"
+    path.write_bytes(snapshot_bytes(dataset))
+    loaded = DiseaseDataset(*read_snapshot(path))
+    assert loaded.key == dataset.key
+    assert loaded.years == dataset.years and loaded.diseases == dataset.diseases
+    assert np.array_equal(loaded.cube.values, dataset.cube.values)
+    assert np.array_equal(loaded.cube.observed, dataset.cube.observed)
+    pd.testing.assert_frame_equal(loaded.slice(2010, "Hydrocele"), dataset.slice(2010, "Hydrocele"))
+
+
+def test_topology_round_trip():
+    left = shapely.box(0, 0, 1, 1)
+    right = shapely.box(1, 0, 2, 1)
+    holed = shapely.box(3, 0, 5, 2).difference(shapely.box(3.5, 0.5, 4.5, 1.5))
+    geometries = [left, right, holed, shapely.Polygon()]
+    topology = encode(geometries, quantization=1001)
+
+    decoded = decode(topology)
+    assert decoded[3] is None
+    for original, geometry in zip(geometries[:3], decoded):
+        shape = shapely.geometry.shape(geometry)
+        assert shape.is_valid
+        assert shape.symmetric_difference(original).area < 1e-9
+    # The border of the two boxes is stored once, as a single arc used both ways
+    assert len(topology["arcs"]) == 5